@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from sshtunnel import BaseSSHTunnelForwarderError, SSHTunnelForwarder
 
 from .logging import setup_logger
+from .metrics import metrics
 
 logger = setup_logger()
 
@@ -37,6 +38,7 @@ class SSHTunnel:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
 
+    @metrics.timed("tunnel.start")
     def start(self) -> None:
         try:
             self.server.start()
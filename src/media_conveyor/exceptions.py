@@ -11,3 +11,17 @@ class TerminationError(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
+
+
+class ResourceWaitError(Exception):
+    """Exception raised when AWS resources fail, or run out of time, to reach the state being waited for.
+
+    Attributes:
+        message -- explanation of the error
+        statuses -- the last status seen for each resource that was still being waited on
+    """
+
+    def __init__(self, message, statuses=None):
+        self.message = message
+        self.statuses = statuses or {}
+        super().__init__(self.message)
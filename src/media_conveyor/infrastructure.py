@@ -1,23 +1,246 @@
 from __future__ import annotations
 
+import copy
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Tuple
 
 import boto3
 import botocore
 from botocore.exceptions import BotoCoreError, ClientError
 
-from .exceptions import TerminationError
+from .exceptions import ResourceWaitError, TerminationError
 from .logging import setup_logger
-from .utils import generate_password, set_file_permissions
+from .metrics import metrics
+from .utils import generate_password, set_file_permissions, write_json_atomic
 
 logger = setup_logger()
 
 
+class StateFileCache:
+    """Parsed JSON state files, shared by every ``AWSBase`` in the process.
+
+    A file is parsed again only when its modification time, size or inode changes, so reading the state is
+    a ``stat`` call rather than an open and a parse.  Writes go through to disk atomically and refresh the
+    cached copy, and callers always get their own copy of the data.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[tuple, dict]] = {}
+
+    @staticmethod
+    def _signature(path) -> tuple:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def read(self, path) -> dict:
+        key = str(path)
+        with self._lock:
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                self._entries.pop(key, None)
+                raise
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                with open(path, "r") as file:
+                    entry = self._entries[key] = (signature, json.load(file))
+            return copy.deepcopy(entry[1])
+
+    def write(self, path, data: dict) -> None:
+        key = str(path)
+        with self._lock:
+            try:
+                # The state file is made read-only after every write, which a rename replaces regardless.
+                write_json_atomic(path, data, indent=4)
+                set_file_permissions(path)
+                self._entries[key] = (self._signature(path), copy.deepcopy(data))
+            except BaseException:
+                self._entries.pop(key, None)
+                raise
+
+
+state_files = StateFileCache()
+
+
+class ResourceGraph:
+    """Runs provisioning or teardown steps concurrently, each one as soon as every step it depends on has finished.
+
+    A step is called with the results of its dependencies, in the order they were listed, unless it was
+    added with ``pass_results=False``.  Each step is timed into the log and the run metrics as
+    ``aws.<name>``, and one combined progress line is logged whenever a step finishes and every
+    ``progress_interval`` seconds in between.  If a step raises, no further steps are started, the running
+    ones are allowed to finish and the first error is raised.  ``results`` holds the result of every step
+    that finished, so a caller can still record what was done before a failure.
+    """
+
+    def __init__(self, max_workers: int = 4, label: str = "provisioning", progress_interval: float = 30.0) -> None:
+        if not isinstance(max_workers, int) or max_workers <= 0:
+            raise ValueError("max_workers must be a positive integer")
+        self.max_workers = max_workers
+        self.label = label
+        self.progress_interval = progress_interval
+        self._steps: Dict[str, Tuple[Callable, Tuple[str, ...], bool]] = {}
+        self.results: Dict[str, Any] = {}
+
+    def add(self, name: str, func: Callable, *dependencies: str, pass_results: bool = True) -> None:
+        if name in self._steps:
+            raise ValueError(f"Step {name} is already in the graph")
+        unknown = [dependency for dependency in dependencies if dependency not in self._steps]
+        if unknown:
+            # Dependencies must be added first, which also rules out cycles.
+            raise ValueError(f"Step {name} depends on unknown steps: {', '.join(unknown)}")
+        self._steps[name] = (func, dependencies, pass_results)
+
+    def run(self) -> Dict[str, Any]:
+        results = self.results = {}
+        pending = dict(self._steps)
+        running = {}
+        error = None
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, (func, dependencies, pass_results) in list(pending.items()):
+                    if error is None and all(dependency in results for dependency in dependencies):
+                        del pending[name]
+                        arguments = [results[dependency] for dependency in dependencies] if pass_results else []
+                        running[executor.submit(self._run_step, name, func, arguments)] = (name, time.perf_counter())
+                if not running:
+                    break
+                done, _ = wait(running, timeout=self.progress_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, _ = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Step {name} failed: {e}")
+                        error = error or e
+                self._log_progress(results, running)
+        if error is not None:
+            raise error
+        logger.info(f"Finished {self.label} of {len(results)} steps in {time.perf_counter() - start:.1f}s")
+        return results
+
+    def _log_progress(self, results: dict, running: dict) -> None:
+        now = time.perf_counter()
+        waiting = ", ".join(f"{name} ({now - started:.0f}s)" for name, started in running.values())
+        logger.info(
+            f"{self.label.capitalize()}: {len(results)}/{len(self._steps)} steps done"
+            + (f", waiting on {waiting}" if waiting else "")
+        )
+
+    @staticmethod
+    def _run_step(name: str, func: Callable, arguments: list):
+        logger.info(f"Starting step {name}")
+        step_start = time.perf_counter()
+        result = func(*arguments)
+        seconds = time.perf_counter() - step_start
+        metrics.observe(f"aws.{name}", seconds)
+        logger.info(f"Step {name} finished in {seconds:.1f}s")
+        return result
+
+
+# Statuses a waiter gives up on, as the resource will not reach the one being waited for without help.
+INSTANCE_FAILED_STATUSES = ("shutting-down", "terminated", "stopping", "stopped")
+CACHE_FAILED_STATUSES = ("create-failed", "incompatible-network", "incompatible-parameters", "restore-failed")
+
+
+class ResourceWaiter:
+    """Polls a batch of AWS resources until each one reaches one of the ``ready`` statuses.
+
+    ``describe`` is called with the ids still pending and returns the status of each, in a single request
+    where the API allows it.  Ids it leaves out are reported as ``GONE``, which is a ready status for
+    deletions and a pending one while a new resource is not visible yet.  Polls start ``delay`` seconds
+    apart and back off by ``backoff`` up to ``max_delay``, so quick transitions are noticed quickly and
+    slow ones do not burn API calls.  A resource that reaches a ``failed`` status, or is still pending
+    after ``timeout`` seconds, raises ResourceWaitError.  ``on_progress`` is called after every poll with
+    the label, the statuses and the elapsed seconds, and by default logs a progress line.
+    """
+
+    GONE = "gone"
+
+    def __init__(
+        self,
+        label: str,
+        describe: Callable[[List[str]], Dict[str, str]],
+        ready: Collection[str],
+        failed: Collection[str] = (),
+        timeout: float = 1800.0,
+        delay: float = 2.0,
+        max_delay: float = 30.0,
+        backoff: float = 1.5,
+        on_progress: Callable[[str, Dict[str, str], float], None] = None,
+    ) -> None:
+        if timeout <= 0 or delay <= 0 or max_delay < delay or backoff < 1:
+            raise ValueError("timeout and delay must be positive, max_delay at least delay and backoff at least 1")
+        self.label = label
+        self.describe = describe
+        self.ready = set(ready)
+        self.failed = set(failed)
+        self.timeout = timeout
+        self.delay = delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.on_progress = on_progress or self._log_progress
+
+    def wait(self, ids: Iterable[str]) -> Dict[str, str]:
+        pending = list(dict.fromkeys(resource_id for resource_id in ids if resource_id))
+        statuses: Dict[str, str] = {}
+        if not pending:
+            return statuses
+        start = time.monotonic()
+        delay = self.delay
+        polls = 0
+        while True:
+            polls += 1
+            current = self.describe(pending)
+            for resource_id in pending:
+                statuses[resource_id] = current.get(resource_id, self.GONE)
+            elapsed = time.monotonic() - start
+            self.on_progress(self.label, dict(statuses), elapsed)
+            failed = {
+                resource_id: statuses[resource_id] for resource_id in pending if statuses[resource_id] in self.failed
+            }
+            if failed:
+                raise ResourceWaitError(f"Gave up waiting for {self.label}: {self._describe(failed)}", failed)
+            pending = [resource_id for resource_id in pending if statuses[resource_id] not in self.ready]
+            if not pending:
+                break
+            remaining = self.timeout - elapsed
+            if remaining <= 0:
+                waiting = {resource_id: statuses[resource_id] for resource_id in pending}
+                raise ResourceWaitError(
+                    f"Timed out after {elapsed:.0f}s waiting for {self.label}: {self._describe(waiting)}", waiting
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * self.backoff, self.max_delay)
+        metrics.increment("aws.wait_polls", polls)
+        logger.info(f"Done waiting for {self.label} after {polls} polls in {time.monotonic() - start:.1f}s")
+        return statuses
+
+    @staticmethod
+    def _describe(statuses: Dict[str, str]) -> str:
+        return ", ".join(f"{resource_id} ({status})" for resource_id, status in statuses.items())
+
+    def _log_progress(self, label: str, statuses: Dict[str, str], elapsed: float) -> None:
+        pending = {resource_id: status for resource_id, status in statuses.items() if status not in self.ready}
+        if pending:
+            logger.info(f"Waiting for {label} ({elapsed:.0f}s): {self._describe(pending)}")
+
+
 class AWSBase:
-    def __init__(self, aws_state_path: str = None, resource_configs: dict = None):
+    def __init__(
+        self,
+        aws_state_path: str = None,
+        resource_configs: dict = None,
+        wait_timeout: float = 1800.0,
+        wait_progress: Callable[[str, Dict[str, str], float], None] = None,
+    ):
         if resource_configs is None:
             resource_configs = {}
         self.resource_configs = resource_configs
@@ -32,14 +255,13 @@ class AWSBase:
 
         self.ec2_client = boto3.client("ec2")
         self.elasticache_client = boto3.client("elasticache")
+        self.wait_timeout = wait_timeout
+        self.wait_progress = wait_progress
 
     @property
     def current_state(self):
-        # logger.info("Accessing current_state property")
         try:
-            with open(self.aws_state_path, "r") as file:
-                state_data = json.load(file)
-                return state_data
+            return state_files.read(self.aws_state_path)
         except FileNotFoundError:
             logger.error("AWS state file not found. Please create a new state.")
             return None
@@ -51,9 +273,7 @@ class AWSBase:
     def current_state(self, state_data):
         logger.info("Setting current_state property with data: %s", state_data)
         try:
-            with open(self.aws_state_path, "w") as file:
-                json.dump(state_data, file, indent=4)
-            set_file_permissions(self.aws_state_path)
+            state_files.write(self.aws_state_path, state_data)
         except IOError:
             logger.error("Failed to write to the AWS state file. Check your file permissions.")
 
@@ -61,6 +281,63 @@ class AWSBase:
         logger.info("Getting current AWS state")
         return self.current_state
 
+    def _wait_for(self, label: str, describe: Callable, ids: Iterable[str], ready, failed=()) -> Dict[str, str]:
+        waiter = ResourceWaiter(
+            label, describe, ready, failed, timeout=self.wait_timeout, on_progress=self.wait_progress
+        )
+        return waiter.wait(ids)
+
+    def _instance_statuses(self, instance_ids: List[str]) -> Dict[str, str]:
+        try:
+            response = self.ec2_client.describe_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            # New instances can take a moment to become visible, and unknown ids fail the whole request.
+            if e.response["Error"]["Code"] != "InvalidInstanceID.NotFound":
+                raise
+            if len(instance_ids) == 1:
+                return {}
+            # Describing the ids one at a time keeps the statuses of the others, so only the unknown ones are gone.
+            statuses = {}
+            for instance_id in instance_ids:
+                statuses.update(self._instance_statuses([instance_id]))
+            return statuses
+        return {
+            instance["InstanceId"]: instance["State"]["Name"]
+            for reservation in response["Reservations"]
+            for instance in reservation["Instances"]
+        }
+
+    def _cache_cluster_statuses(self, cluster_ids: List[str]) -> Dict[str, str]:
+        # DescribeCacheClusters takes a single id, so several clusters are read from one listing instead.
+        try:
+            if len(cluster_ids) == 1:
+                clusters = self.elasticache_client.describe_cache_clusters(CacheClusterId=cluster_ids[0])
+                clusters = clusters["CacheClusters"]
+            else:
+                paginator = self.elasticache_client.get_paginator("describe_cache_clusters")
+                clusters = [cluster for page in paginator.paginate() for cluster in page["CacheClusters"]]
+        except self.elasticache_client.exceptions.CacheClusterNotFoundFault:
+            return {}
+        return {
+            cluster["CacheClusterId"]: cluster["CacheClusterStatus"]
+            for cluster in clusters
+            if cluster["CacheClusterId"] in cluster_ids
+        }
+
+    def _replication_group_statuses(self, group_ids: List[str]) -> Dict[str, str]:
+        try:
+            if len(group_ids) == 1:
+                groups = self.elasticache_client.describe_replication_groups(ReplicationGroupId=group_ids[0])
+                groups = groups["ReplicationGroups"]
+            else:
+                paginator = self.elasticache_client.get_paginator("describe_replication_groups")
+                groups = [group for page in paginator.paginate() for group in page["ReplicationGroups"]]
+        except self.elasticache_client.exceptions.ReplicationGroupNotFoundFault:
+            return {}
+        return {
+            group["ReplicationGroupId"]: group["Status"] for group in groups if group["ReplicationGroupId"] in group_ids
+        }
+
     def _check_aws_credentials(self):
         logger.info("Checking AWS credentials")
         try:
@@ -137,48 +414,77 @@ class AWSStateData(AWSBase):
 
 
 class AWSResourceCreator(AWSBase):
-    def create_state(self):
+    def create_state(self, max_workers: int = 4):
         logger.info(">------------ Creating new AWS state ------------<")
-        vpc_id = self._create_vpc()
-        subnet_id = self._create_subnet(vpc_id)
-        internet_gateway_id = self._create_internet_gateway(vpc_id)
-        route_table_id = self._modify_route_table(vpc_id, internet_gateway_id)
-        ec2_security_group_id = self._create_ec2_security_group(vpc_id)
-        cache_security_group_id = self._create_elasticache_security_group(ec2_security_group_id, vpc_id)
-        instance_id = self._create_ec2_instance(subnet_id, ec2_security_group_id)
+        # Read before the instance step, which strips UserName from the EC2 parameters.
         ec2_username = self.resource_configs.get("ec2", {}).get("UserName", "ec2-user")
-        cache_subnet_group_name, cluster_id = self._create_elasticache_cluster(
-            subnet_id, vpc_id, cache_security_group_id
-        )
+
+        # The EC2 instance and the ElastiCache cluster take the longest and only share the subnet and the
+        # security groups, so they are created side by side.
+        graph = ResourceGraph(max_workers, "provisioning")
+        graph.add("vpc", self._create_vpc)
+        graph.add("subnet", self._create_subnet, "vpc")
+        graph.add("internet_gateway", self._create_internet_gateway, "vpc")
+        graph.add("route_table", self._modify_route_table, "vpc", "internet_gateway")
+        graph.add("ec2_security_group", self._create_ec2_security_group, "vpc")
+        graph.add("cache_security_group", self._create_elasticache_security_group, "ec2_security_group", "vpc")
+        # Waiting is a step of its own, so a resource that never becomes ready is still in the results.
+        graph.add("ec2_instance", self._create_ec2_instance, "subnet", "ec2_security_group")
+        graph.add("ec2_instance_running", self._wait_for_ec2_instance, "ec2_instance")
+        graph.add("cache_subnet_group", self._create_cache_subnet_group, "subnet", "vpc")
+        graph.add("elasticache_cluster", self._create_elasticache_cluster, "cache_subnet_group", "cache_security_group")
+        graph.add("elasticache_cluster_available", self._wait_for_elasticache_cluster, "elasticache_cluster")
+        try:
+            graph.run()
+        except Exception:
+            # Whatever was created before the failure is written down, so terminate_state can remove it.
+            self.current_state = self._state_data(graph.results, ec2_username)
+            logger.error("Provisioning failed. The resources created so far were saved for terminate_state.")
+            raise
 
         # Write data to a file
+        self.current_state = self._state_data(graph.results, ec2_username)
+
+    @staticmethod
+    def _state_data(results: Dict[str, Any], ec2_username: str) -> dict:
         state_data = {
-            "VpcId": vpc_id,
-            "SubnetId": subnet_id,
-            "SecurityGroupIds": [ec2_security_group_id, cache_security_group_id],
-            "CacheSubnetGroupName": cache_subnet_group_name,
-            "InstanceIds": [instance_id],
+            "VpcId": results.get("vpc"),
+            "SubnetId": results.get("subnet"),
+            "SecurityGroupIds": [
+                results[step] for step in ("ec2_security_group", "cache_security_group") if results.get(step)
+            ],
+            "CacheSubnetGroupName": results.get("cache_subnet_group"),
+            "InstanceIds": [results["ec2_instance"]] if results.get("ec2_instance") else [],
             "UserName": ec2_username,
-            "CacheClusterId": cluster_id,
-            "InternetGatewayId": internet_gateway_id,
-            "RouteTableId": route_table_id,
+            "CacheClusterId": results.get("elasticache_cluster"),
+            "InternetGatewayId": results.get("internet_gateway"),
+            "RouteTableId": results.get("route_table"),
         }
+        return {key: value for key, value in state_data.items() if value}
 
-        self.current_state = state_data
-
-    def terminate_state(self):
+    def terminate_state(self, max_workers: int = 4):
         logger.info("<------------ Terminating AWS state ------------>")
-        if self.current_state is None:
+        current_state = self.current_state
+        if current_state is None:
             return
         try:
-            self._terminate_ec2_instance()
-            self._terminate_elasticache_cluster()
-            self._delete_cache_subnet_group()
-            self._delete_subnets()
-            self._delete_security_groups()
-            self._delete_internet_gateways()
-            self._delete_route_tables()
-            self._delete_vpc()
+            # The instance and the cache are deleted side by side, and each network resource goes as soon as
+            # nothing that uses it is left.
+            graph = ResourceGraph(max_workers, "teardown")
+            graph.add("ec2_instance", self._terminate_ec2_instance, pass_results=False)
+            graph.add("elasticache_cluster", self._terminate_elasticache_cluster, pass_results=False)
+            cache_steps = ["elasticache_cluster"]
+            if current_state.get("ReplicationGroupId"):
+                graph.add("replication_group", self._terminate_elasticache_replication_group, pass_results=False)
+                cache_steps.append("replication_group")
+            graph.add("cache_subnet_group", self._delete_cache_subnet_group, *cache_steps, pass_results=False)
+            graph.add("security_groups", self._delete_security_groups, "ec2_instance", *cache_steps, pass_results=False)
+            graph.add("subnets", self._delete_subnets, "ec2_instance", "cache_subnet_group", pass_results=False)
+            graph.add("internet_gateway", self._delete_internet_gateways, "ec2_instance", pass_results=False)
+            graph.add("route_tables", self._delete_route_tables, "subnets", "internet_gateway", pass_results=False)
+            graph.add("vpc", self._delete_vpc, "security_groups", "subnets", "route_tables", pass_results=False)
+            graph.add("key_pair", self._delete_key_pair, "ec2_instance", pass_results=False)
+            graph.run()
 
             # Clean up files after successful termination
             if os.path.exists(self.aws_state_path):
@@ -199,9 +505,8 @@ class AWSResourceCreator(AWSBase):
                     logger.error(f"Failed to remove {key_pair_path}. Error: {str(e)}")
             else:
                 logger.info(f"{key_pair_path} does not exist")
-            self._delete_key_pair()
 
-        except (BotoCoreError, ClientError) as e:
+        except (BotoCoreError, ClientError, ResourceWaitError) as e:
             logger.error(f"Failed to terminate state. Error: {str(e)}")
             raise TerminationError(str(e)) from e
 
@@ -337,6 +642,12 @@ class AWSResourceCreator(AWSBase):
         params["KeyName"] = key_pair_name
         return self._create_resource(self.ec2_client, "run_instances", params, "Instances")
 
+    def _wait_for_ec2_instance(self, instance_id: str) -> None:
+        # The public DNS name, which AWSStateData connects through, is only assigned once the instance runs.
+        self._wait_for(
+            "EC2 instance to run", self._instance_statuses, [instance_id], ("running",), INSTANCE_FAILED_STATUSES
+        )
+
     def _create_cache_subnet_group(self, subnet_id: str, vpc_id: str) -> str:
         logger.info("Creating cache subnet group for subnet: %s and VPC: %s", subnet_id, vpc_id)
 
@@ -395,29 +706,45 @@ class AWSResourceCreator(AWSBase):
             params,
             "ReplicationGroup",
         )
+        self._wait_for(
+            "ElastiCache replication group to become available",
+            self._replication_group_statuses,
+            [replication_group_id],
+            ("available",),
+            CACHE_FAILED_STATUSES,
+        )
         return cache_subnet_group_name, replication_group_id, auth_token
 
-    def _create_elasticache_cluster(self, subnet_id, vpc_id, cache_security_group_id) -> Tuple[str, str]:
+    def _create_elasticache_cluster(self, cache_subnet_group_name, cache_security_group_id) -> str:
         logger.info(
-            "Creating ElastiCache cluster for subnet: %s, VPC: %s and security group: %s",
-            subnet_id,
-            vpc_id,
+            "Creating ElastiCache cluster for cache subnet group: %s and security group: %s",
+            cache_subnet_group_name,
             cache_security_group_id,
         )
 
         params = self.resource_configs.get("elasticache_cluster", {})
-        cache_subnet_group_name = self._create_cache_subnet_group(subnet_id, vpc_id)
         params["CacheSubnetGroupName"] = cache_subnet_group_name
         if params["CacheSubnetGroupName"] is None:
             return None
         params["SecurityGroupIds"] = [cache_security_group_id]
-        cluster_id = self._create_resource(
+        return self._create_resource(
             self.elasticache_client,
             "create_cache_cluster",
             params,
             "CacheCluster",
         )
-        return cache_subnet_group_name, cluster_id
+
+    def _wait_for_elasticache_cluster(self, cluster_id: str) -> None:
+        if cluster_id is None:
+            return
+        # Cache nodes have no endpoint until the cluster is available.
+        self._wait_for(
+            "ElastiCache cluster to become available",
+            self._cache_cluster_statuses,
+            [cluster_id],
+            ("available",),
+            CACHE_FAILED_STATUSES,
+        )
 
     def _create_resource(self, client, method, params, resource_type):
         logger.info("Creating resource of type: %s with params: %s", resource_type, params)
@@ -470,8 +797,11 @@ class AWSResourceCreator(AWSBase):
 
             logger.info(f"Instance {instance_id} transitioning from '{previous_state}' to '{current_state}'")
 
-            waiter = self.ec2_client.get_waiter("instance_terminated")
-            waiter.wait(InstanceIds=[instance_id])
+        instance_ids = [instance["InstanceId"] for instance in terminating_instances]
+        self._wait_for(
+            "EC2 instances to terminate", self._instance_statuses, instance_ids, ("terminated", ResourceWaiter.GONE)
+        )
+        for instance_id in instance_ids:
             logger.info(f"Instance {instance_id} has been terminated.")
 
     def _terminate_elasticache_cluster(self):
@@ -492,14 +822,30 @@ class AWSResourceCreator(AWSBase):
             return
 
         cluster_status = response["CacheClusters"][0]["CacheClusterStatus"]
-        if cluster_status != "available":
-            logger.info(f"ElastiCache cluster {cluster_id} is not in 'available' state.")
+        if cluster_status == "creating":
+            # A cluster left behind by a failed provisioning run can only be deleted once it settles.
+            statuses = self._wait_for(
+                "ElastiCache cluster to settle",
+                self._cache_cluster_statuses,
+                [cluster_id],
+                ("available", ResourceWaiter.GONE, *CACHE_FAILED_STATUSES),
+            )
+            cluster_status = statuses[cluster_id]
+            if cluster_status == ResourceWaiter.GONE:
+                logger.info(f"ElastiCache cluster {cluster_id} does not exist.")
+                return
+        if cluster_status != "available" and cluster_status not in CACHE_FAILED_STATUSES:
+            logger.info(f"ElastiCache cluster {cluster_id} is in the '{cluster_status}' state and cannot be deleted.")
             return
 
         self.elasticache_client.delete_cache_cluster(CacheClusterId=cluster_id)
 
-        waiter = self.elasticache_client.get_waiter("cache_cluster_deleted")
-        waiter.wait(CacheClusterId=cluster_id)
+        self._wait_for(
+            "ElastiCache cluster to be deleted",
+            self._cache_cluster_statuses,
+            [cluster_id],
+            ("deleted", ResourceWaiter.GONE),
+        )
         logger.info(f"ElastiCache cluster {cluster_id} has been terminated.")
 
     def _terminate_elasticache_replication_group(self):
@@ -525,8 +871,12 @@ class AWSResourceCreator(AWSBase):
 
         self.elasticache_client.delete_replication_group(ReplicationGroupId=replication_group_id)
 
-        waiter = self.elasticache_client.get_waiter("replication_group_deleted")
-        waiter.wait(ReplicationGroupId=replication_group_id)
+        self._wait_for(
+            "ElastiCache replication group to be deleted",
+            self._replication_group_statuses,
+            [replication_group_id],
+            ("deleted", ResourceWaiter.GONE),
+        )
         logger.info(f"ElastiCache replication group {replication_group_id} has been terminated.")
 
     def _delete_cache_subnet_group(self):
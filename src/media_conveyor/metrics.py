@@ -0,0 +1,173 @@
+import functools
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from .logging import setup_logger
+from .utils import write_json_atomic, write_text_atomic
+
+logger = setup_logger()
+
+
+class StageStats:
+    # Percentiles come from a uniform sample of at most this many calls, so a long run stays in bounded memory.
+    RESERVOIR_SIZE = 1024
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.items = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.durations: List[float] = []
+
+    def observe(self, seconds: float, items: int = 0, size: int = 0) -> None:
+        self.calls += 1
+        self.items += items
+        self.bytes += size
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if len(self.durations) < self.RESERVOIR_SIZE:
+            self.durations.append(seconds)
+        else:
+            # Reservoir sampling: every call so far has the same chance of being in the sample.
+            slot = random.randrange(self.calls)
+            if slot < self.RESERVOIR_SIZE:
+                self.durations[slot] = seconds
+
+    def percentile(self, fraction: float) -> float:
+        # Nearest-rank percentile over the sampled calls, which is every call until the reservoir fills.
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+    def summary(self) -> dict:
+        total = self.total_seconds
+        return {
+            "calls": self.calls,
+            "items": self.items,
+            "bytes": self.bytes,
+            "total_seconds": round(total, 6),
+            "items_per_second": round(self.items / total, 2) if total else 0.0,
+            "p50_seconds": round(self.percentile(0.5), 6),
+            "p95_seconds": round(self.percentile(0.95), 6),
+            "max_seconds": round(self.max_seconds, 6),
+        }
+
+
+class RunMetrics:
+    """Timers and counters for one harvest and upload run.
+
+    Stages are named ``<component>.<step>``, e.g. ``plex.episodes`` or ``redis.chunk``.  Each stage records
+    its call latencies along with the items and bytes it handled, so a run report shows where the time
+    went.  Every recording method is thread safe, as the Plex worker pool and Redis pipelines report in
+    from their own threads.
+    """
+
+    PROMETHEUS_PREFIX = "media_conveyor"
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.perf_counter()
+            self._stages: Dict[str, StageStats] = {}
+            self._counters: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float, items: int = 0, size: int = 0) -> None:
+        with self._lock:
+            self._stages.setdefault(stage, StageStats()).observe(seconds, items, size)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, items: int = 0, size: int = 0):
+        """Time the body as one call of ``stage``.  Items found inside the body can be added to the yielded dict."""
+        counts = {"items": items, "bytes": size}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.observe(stage, time.perf_counter() - start, counts["items"], counts["bytes"])
+
+    def timed(self, stage: str, count_result: bool = False):
+        """Decorator form of ``timer``.  With ``count_result`` the length of the return value is counted as items."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage) as counts:
+                    result = func(*args, **kwargs)
+                    if count_result:
+                        counts["items"] = len(result)
+                    return result
+
+            return wrapper
+
+        return decorator
+
+    def report(self) -> dict:
+        with self._lock:
+            stages = {name: stats.summary() for name, stats in sorted(self._stages.items())}
+            counters = dict(sorted(self._counters.items()))
+        return {
+            "started_at": self.started_at,
+            "duration_seconds": round(time.perf_counter() - self._started, 6),
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_report(self, report_path: Path) -> dict:
+        report = self.report()
+        write_json_atomic(report_path, report, indent=4)
+        logger.info(f"Wrote run report to {report_path}")
+        return report
+
+    def prometheus(self) -> str:
+        """Render the run in the Prometheus text exposition format, for the node exporter's textfile collector."""
+        report = self.report()
+        prefix = self.PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latency of each pipeline stage call.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, summary in report["stages"].items():
+            labels = f'stage="{stage}"'
+            lines.append(f'{prefix}_stage_seconds{{{labels},quantile="0.5"}} {summary["p50_seconds"]}')
+            lines.append(f'{prefix}_stage_seconds{{{labels},quantile="0.95"}} {summary["p95_seconds"]}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {summary['total_seconds']}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {summary['calls']}")
+        for metric, field, help_text in (
+            ("stage_items_total", "items", "Items handled by each pipeline stage."),
+            ("stage_bytes_total", "bytes", "Bytes handled by each pipeline stage."),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for stage, summary in report["stages"].items():
+                lines.append(f'{prefix}_{metric}{{stage="{stage}"}} {summary[field]}')
+        lines.append(f"# HELP {prefix}_events_total Named event counters.")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for counter, value in report["counters"].items():
+            lines.append(f'{prefix}_events_total{{name="{counter}"}} {value}')
+        lines.append(f"# HELP {prefix}_run_duration_seconds Wall clock time of the run so far.")
+        lines.append(f"# TYPE {prefix}_run_duration_seconds gauge")
+        lines.append(f"{prefix}_run_duration_seconds {report['duration_seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, prometheus_path: Path) -> None:
+        # The textfile collector may read at any moment, so the file is swapped in whole.
+        write_text_atomic(prometheus_path, self.prometheus())
+        logger.info(f"Wrote Prometheus metrics to {prometheus_path}")
+
+
+metrics = RunMetrics()
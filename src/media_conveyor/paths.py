@@ -0,0 +1,123 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional
+
+from .logging import setup_logger
+
+logger = setup_logger()
+
+# Stored alongside the records, relative to the version prefix like the digest index.
+PATH_ROOTS_KEY = "meta:path_roots"
+# Compressed paths look like "{3f9a1c}/Artist/Album/01 Track.flac".  Plex only reports absolute paths, which
+# start with a separator or a drive letter, so a leading "{<id>}" cannot be mistaken for a real path.
+COMPRESSED_PATH = re.compile(r"^\{([0-9a-f]+)\}")
+SEPARATORS = ("/", "\\")
+
+
+class PathRoots:
+    """A small table of library root folders that lets records store ``{<id>}<suffix>`` instead of full paths.
+
+    The table is written to Redis once as a hash of ``id -> root`` under ``PATH_ROOTS_KEY``, and readers
+    expand records with ``expand_record``.  Paths outside every root are stored unchanged, so a record may
+    freely mix compressed and plain paths.  Ids are derived from the root itself, so a root keeps its id
+    whatever order the sections are listed in and records written by an earlier run stay readable.
+    """
+
+    ID_LENGTH = 6
+
+    def __init__(self, roots: Dict[str, str] = None) -> None:
+        self._roots: Dict[str, str] = {}
+        self._ids: Dict[str, str] = {}
+        for root_id, root in (roots or {}).items():
+            self._roots[str(root_id)] = root
+            self._ids[root] = str(root_id)
+        self._by_length: List[str] = sorted(self._ids, key=len, reverse=True)
+
+    @classmethod
+    def from_sections(cls, sections: Iterable) -> "PathRoots":
+        path_roots = cls()
+        for section in sections:
+            for location in section.locations:
+                path_roots.add(location)
+        logger.info(f"Compressing paths under {len(path_roots)} library roots")
+        return path_roots
+
+    def add(self, root: str) -> str:
+        root = root.rstrip("/\\")
+        if root not in self._ids:
+            root_id = self._root_id(root)
+            self._roots[root_id] = root
+            self._ids[root] = root_id
+            self._by_length = sorted(self._ids, key=len, reverse=True)
+        return self._ids[root]
+
+    def _root_id(self, root: str) -> str:
+        digest = hashlib.blake2b(root.encode("utf-8"), digest_size=8).hexdigest()
+        # The id grows past ID_LENGTH only when a shorter one is already taken by another root.
+        for length in range(self.ID_LENGTH, len(digest) + 1):
+            if digest[:length] not in self._roots:
+                return digest[:length]
+        raise ValueError(f"Could not assign an id to library root {root}")
+
+    def __len__(self) -> int:
+        return len(self._roots)
+
+    def compress(self, path: str) -> str:
+        if not isinstance(path, str):
+            return path
+        for root in self._by_length:
+            if path.startswith(root) and path[len(root) : len(root) + 1] in SEPARATORS:
+                return f"{{{self._ids[root]}}}{path[len(root) :]}"
+        return path
+
+    def expand(self, path: str) -> str:
+        if not isinstance(path, str):
+            return path
+        match = COMPRESSED_PATH.match(path)
+        if match is None or match.group(1) not in self._roots:
+            return path
+        return self._roots[match.group(1)] + path[match.end() :]
+
+    def compress_joined(self, paths: str, separator: str = ";") -> str:
+        return separator.join(self.compress(path) for path in paths.split(separator))
+
+    def expand_joined(self, paths: str, separator: str = ";") -> str:
+        return separator.join(self.expand(path) for path in paths.split(separator))
+
+    def expand_record(self, record: dict) -> dict:
+        """Expand every compressed path of a decoded record in place, and return it."""
+        for field, value in record.items():
+            if field == "file_path" and isinstance(value, str):
+                record[field] = self.expand_joined(value)
+            elif field == "show_location":
+                record[field] = self.expand(value)
+            elif field == "tracks" and isinstance(value, dict):
+                for track in value.values():
+                    self._expand_track(track)
+            elif field.startswith("track:") and isinstance(value, dict):
+                self._expand_track(value)
+        return record
+
+    def _expand_track(self, track: dict) -> None:
+        locations = track.get("track_location")
+        if isinstance(locations, list):
+            track["track_location"] = [self.expand(location) for location in locations]
+
+    def to_record(self) -> Dict[str, str]:
+        return dict(self._roots)
+
+    def fingerprint(self) -> str:
+        # Compressed records are only readable with the table they were built with.
+        payload = "\n".join(f"{root_id}={root}" for root_id, root in sorted(self._roots.items()))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=4).hexdigest()
+
+    @classmethod
+    def from_record(cls, record: Optional[dict]) -> Optional["PathRoots"]:
+        if not record:
+            return None
+        return cls(
+            {
+                (k.decode("utf-8") if isinstance(k, bytes) else k): (v.decode("utf-8") if isinstance(v, bytes) else v)
+                for k, v in record.items()
+            }
+        )
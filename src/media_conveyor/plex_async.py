@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import List, Tuple
+from urllib.parse import urlencode
+from xml.etree import ElementTree
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from plexapi.exceptions import BadRequest, NotFound, Unauthorized
+from plexapi.utils import searchType
+
+from .logging import setup_logger
+from .plex_data import PlexData
+from .records import ArtistRecord, MovieRecord, ShowRecord, shared
+from .value_codecs import JSONCodec, ValueCodec
+
+logger = setup_logger()
+
+
+class AsyncPlexData:
+    """Harvest the same movie, show and music dicts as ``PlexData`` with concurrent asyncio requests.
+
+    ``PlexData`` walks the library through plexapi objects one request at a time.  This harvester reads the
+    same library XML directly and keeps up to ``max_connections`` requests in flight, which matters most for
+    shows and music where every season and album is a request of its own.  Use it as an async context
+    manager so the HTTP session is opened and closed around the harvest::
+
+        async with AsyncPlexData(baseurl, token) as plex_data:
+            db = await plex_data.compile_libraries(movies=True, shows=True)
+    """
+
+    NON_ALPHANUMERIC = PlexData.NON_ALPHANUMERIC
+    CONTAINER_SIZE = 1000
+
+    def __init__(
+        self,
+        baseurl: str,
+        token: str,
+        max_connections: int = 8,
+        timeout: float = 30,
+        codec: ValueCodec = None,
+    ):
+        if aiohttp is None:
+            raise ImportError("AsyncPlexData requires the aiohttp package. Install media_conveyor[async].")
+        if not isinstance(max_connections, int) or max_connections <= 0:
+            raise ValueError("max_connections must be a positive integer")
+        self.baseurl = baseurl.rstrip("/")
+        self.token = token
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.codec = codec if codec is not None else JSONCodec()
+        self._session = None
+        self._semaphore = None
+        self._sections = None
+
+    async def __aenter__(self) -> "AsyncPlexData":
+        # The connector and the semaphore share one limit: the connector caps open sockets, while the
+        # semaphore keeps queued requests from starting their timeouts before a connection is free.
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            headers={"X-Plex-Token": self.token, "Accept": "application/xml"},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def query(self, key: str, params: dict = None, headers: dict = None) -> ElementTree.Element:
+        if self._session is None:
+            raise RuntimeError("AsyncPlexData must be used as an async context manager")
+        url = f"{self.baseurl}{key}"
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        async with self._semaphore:
+            async with self._session.get(url, headers=headers) as response:
+                body = await response.read()
+                if response.status >= 400:
+                    message = f"({response.status}) {response.reason}; {url}"
+                    if response.status == 401:
+                        raise Unauthorized(message)
+                    if response.status == 404:
+                        raise NotFound(message)
+                    raise BadRequest(message)
+        return ElementTree.fromstring(body) if body.strip() else None
+
+    async def fetch_items(self, key: str, params: dict = None) -> List[ElementTree.Element]:
+        # The first page reports the total size, after which every remaining page is requested at once.
+        first = await self.query(key, params, self._container_headers(0))
+        items = list(first)
+        total_size = int(first.get("totalSize") or first.get("size") or len(items))
+        starts = range(self.CONTAINER_SIZE, total_size, self.CONTAINER_SIZE)
+        pages = await asyncio.gather(*(self.query(key, params, self._container_headers(start)) for start in starts))
+        for page in pages:
+            items.extend(page)
+        section_id = first.get("librarySectionID")
+        if section_id:
+            for item in items:
+                item.set("librarySectionID", section_id)
+        return items
+
+    def _container_headers(self, start: int) -> dict:
+        return {"X-Plex-Container-Start": str(start), "X-Plex-Container-Size": str(self.CONTAINER_SIZE)}
+
+    async def _get_sections(self, section_type: str) -> List[ElementTree.Element]:
+        try:
+            if self._sections is None:
+                # Movies, shows and music are harvested side by side, so they share one sections request.
+                self._sections = asyncio.ensure_future(self.query("/library/sections"))
+            sections = [section for section in await self._sections if section.get("type") == section_type]
+            logger.debug(f"Retrieved {len(sections)} {section_type} sections")
+            return sections
+        except BadRequest as e:
+            logger.error(f"Failed to get sections of type {section_type} due to bad request: {e}")
+            raise
+        except NotFound as e:
+            logger.error(f"Failed to get sections of type {section_type} due to resource not found: {e}")
+            raise
+        except Exception as e:
+            logger.critical(f"Failed to get sections of type {section_type} due to unexpected error: {e}")
+            raise
+
+    async def _section_items(self, section_type: str) -> List[ElementTree.Element]:
+        sections = await self._get_sections(section_type)
+        listings = await asyncio.gather(
+            *(self.fetch_items(f"/library/sections/{section.get('key')}/all") for section in sections)
+        )
+        return [item for listing in listings for item in listing]
+
+    async def get_movies_db(self) -> dict:
+        movies = await self._section_items("movie")
+        logger.info(f"Retrieved {len(movies)} movies")
+        movies_db = dict(self._movie_record(movie) for movie in movies)
+        logger.info("Generated movies database")
+        return movies_db
+
+    async def get_shows_db(self) -> dict:
+        shows = await self._section_items("show")
+        logger.info(f"Retrieved {len(shows)} shows")
+        shows_db = dict(await asyncio.gather(*(self._show_record(show) for show in shows)))
+        logger.info("Generated TV shows database")
+        return shows_db
+
+    async def get_music_db(self) -> dict:
+        music = await self._section_items("artist")
+        logger.info(f"Retrieved {len(music)} music")
+        music_db = dict(await asyncio.gather(*(self._artist_record(artist) for artist in music)))
+        logger.info("Generated music database")
+        return music_db
+
+    async def compile_libraries(self, movies=False, shows=False, music=False) -> dict:
+        libraries = []
+        if movies:
+            libraries.append(self.get_movies_db())
+        if shows:
+            libraries.append(self.get_shows_db())
+        if music:
+            libraries.append(self.get_music_db())
+        libraries_db = {}
+        try:
+            for library_db in await asyncio.gather(*libraries):
+                libraries_db.update(library_db)
+            logger.info("Libraries packaged")
+            return libraries_db
+        except BadRequest as e:
+            logger.error(f"Failed to package libraries due to bad request: {e}")
+            raise
+        except NotFound as e:
+            logger.error(f"Failed to package libraries due to resource not found: {e}")
+            raise
+        except Exception as e:
+            logger.critical(f"Failed to package libraries due to unexpected error: {e}")
+            raise
+
+    def _movie_record(self, movie: ElementTree.Element) -> Tuple[str, dict]:
+        movie_name = self.NON_ALPHANUMERIC.sub("", movie.get("title")).strip()
+        db = MovieRecord(
+            movie.get("title") or "empty",
+            shared(self._int(movie.get("year")) or "empty"),
+            ";".join(self._locations(movie)),
+            movie.get("thumb") or "empty",
+            self._int(movie.get("addedAt")) or "empty",
+        )
+        return f"movie:{movie_name}:{self._int(movie.get('year'))}", db
+
+    async def _show_record(self, show: ElementTree.Element) -> Tuple[str, dict]:
+        show_name = self.NON_ALPHANUMERIC.sub("", show.get("title")).strip()
+        locations = [location.get("path") for location in show.findall("Location")]
+        if not locations:
+            # Some listings leave out the show folders, which the full metadata always carries.
+            details = await self.query(f"/library/metadata/{show.get('ratingKey')}")
+            locations = [location.get("path") for location in details.iter("Location")]
+        db = ShowRecord(
+            show.get("title") or "empty",
+            shared(self._int(show.get("year")) or "empty"),
+            show.get("thumb") or "empty",
+            locations[0],
+            self._int(show.get("addedAt")) or "empty",
+            self.codec.encode(await self._get_episodes(show)),
+        )
+        return f"movie:{show_name}:{self._int(show.get('year'))}", db
+
+    async def _get_episodes(self, show: ElementTree.Element) -> dict:
+        seasons = await self.fetch_items(f"/library/metadata/{show.get('ratingKey')}/children", {"excludeAllLeaves": 1})
+        season_episodes = await asyncio.gather(
+            *(self.fetch_items(f"/library/metadata/{season.get('ratingKey')}/children") for season in seasons)
+        )
+        episode_dict = {}
+        for season, episodes in zip(seasons, season_episodes):
+            season_dict = episode_dict[f"season:{self._int(season.get('index'))}"] = {}
+            for episode in episodes:
+                season_dict[f"episode:{self._int(episode.get('index'))}"] = {
+                    "episode_name": episode.get("title"),
+                    "episode_filename": Path(self._locations(episode)[0]).stem,
+                }
+        return episode_dict
+
+    async def _artist_record(self, artist: ElementTree.Element) -> Tuple[str, dict]:
+        artist_title = artist.get("title") or "empty"
+        artist_name = self.NON_ALPHANUMERIC.sub("", artist_title).strip()
+        db = ArtistRecord(
+            artist_title,
+            artist.get("thumb") or "empty",
+            self._int(artist.get("addedAt")) or "empty",
+            self.codec.encode(await self._get_tracks(artist)),
+        )
+        return f"artist:{artist_name}", db
+
+    async def _get_tracks(self, artist: ElementTree.Element) -> dict:
+        # Same album search as plexapi's Artist.albums(), so albums come back in the same order.
+        albums = await self.fetch_items(
+            f"/library/sections/{artist.get('librarySectionID')}/all",
+            {"type": searchType("album"), "artist.id": artist.get("ratingKey")},
+        )
+        album_tracks = await asyncio.gather(
+            *(self.fetch_items(f"/library/metadata/{album.get('ratingKey')}/children") for album in albums)
+        )
+        track_db = {}
+        for album, tracks in zip(albums, album_tracks):
+            for track in tracks:
+                track_db[f"{album.get('title')}:{self._int(album.get('year'))}"] = {
+                    "track_number": self._int(track.get("index")) or "empty",
+                    "track_name": track.get("title") or "empty",
+                    "track_location": self._locations(track) or "empty",
+                }
+        return track_db
+
+    @staticmethod
+    def _locations(item: ElementTree.Element) -> List[str]:
+        return [part.get("file") for part in item.iter("Part") if part.get("file")]
+
+    @staticmethod
+    def _int(value):
+        return int(value) if value not in (None, "") else None
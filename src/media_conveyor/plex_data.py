@@ -3,28 +3,96 @@ from __future__ import annotations
 # import json5 as json
 import json
 import re
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
 
 from plexapi.exceptions import BadRequest, NotFound
 from plexapi.server import PlexServer
+from plexapi.utils import searchType
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
 
 from .logging import setup_logger
+from .metrics import metrics
+from .paths import PATH_ROOTS_KEY, PathRoots
+from .plex_lean import LEAN_PARAMS, LeanItem, parse_items
+from .records import ArtistRecord, MovieRecord, ShowRecord, SortedSetRecord, clear_shared, shared
+from .serialization import EpisodeRows, SerializationPool, TrackRows, episodes_payload, tracks_payload
+from .snapshot import SnapshotCache
+from .state import SyncState
+from .utils import RateLimiter
+from .value_codecs import JSONCodec, ValueCodec
 
 logger = setup_logger()
 
 
 class PlexData(PlexServer):
     NON_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9]")
+    DEFAULT_PAGE_SIZE = 1000
+    DEFAULT_RETRIES = 3
+    DEFAULT_BACKOFF = 1.0
+    # Episodes and tracks change without bumping their show or artist.
+    LEAF_TYPES = {"show": "episode", "artist": "track"}
 
-    def __init__(self, baseurl=None, token=None, session=None, timeout=None):
+    def __init__(
+        self,
+        baseurl=None,
+        token=None,
+        session=None,
+        timeout=None,
+        max_workers: int = 4,
+        requests_per_second=None,
+        bulk: bool = False,
+        codec: ValueCodec = None,
+        compress_paths: bool = False,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        lean: bool = False,
+        serialize_workers: int = 0,
+    ):
         self._movies_db = None
         self._shows_db = None
         self._music_db = None
+        self.bulk = bulk
+        self.lean = lean
+        self.codec = codec if codec is not None else JSONCodec()
+        self._serializer = SerializationPool(self.codec, serialize_workers) if serialize_workers else None
+        # Episode and track rows keyed by section key, then by show or artist ratingKey.
+        self._bulk_leaves: Dict[str, Dict[int, list]] = {}
+        if not isinstance(max_workers, int) or max_workers <= 0:
+            raise ValueError("max_workers must be a positive integer")
+        self.max_workers = max_workers
+        if not isinstance(page_size, int) or page_size <= 0:
+            raise ValueError("page_size must be a positive integer")
+        if not isinstance(retries, int) or retries < 0:
+            raise ValueError("retries must be a non-negative integer")
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self._rate_limiter = RateLimiter(requests_per_second) if requests_per_second else None
+        if session is None:
+            # Every worker shares this session, so its connection pool is sized to the worker pool.
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        session.hooks["response"].append(self._record_response)
         try:
             super().__init__(baseurl, token, session, timeout)
             self._movie_sections = self._get_sections("movie")
             self._shows_sections = self._get_sections("show")
             self._music_sections = self._get_sections("artist")
+            self.path_roots = None
+            if compress_paths:
+                self.path_roots = PathRoots.from_sections(
+                    self._movie_sections + self._shows_sections + self._music_sections
+                )
             logger.info("PlexData initialized successfully")
         except BadRequest as e:
             logger.error(f"Failed to initialize PlexData due to bad request: {e}")
@@ -36,6 +104,41 @@ class PlexData(PlexServer):
             logger.critical(f"Failed to initialize PlexData due to unexpected error: {e}")
             raise
 
+    def query(self, key, *args, **kwargs):
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        return super().query(key, *args, **kwargs)
+
+    @staticmethod
+    def _record_response(response, *args, **kwargs):
+        metrics.observe("plex.http", response.elapsed.total_seconds(), 1, len(response.content))
+
+    def _encode(self, value) -> str:
+        with metrics.timer("serialize") as counts:
+            encoded = self.codec.encode(value)
+            counts["bytes"] = len(encoded)
+        return encoded
+
+    def _map_items(self, func, items) -> list:
+        return list(self._imap_items(func, items))
+
+    def _imap_items(self, func, items) -> Iterator:
+        # Results are yielded in input order, so the output is the same however the work is scheduled.  Only a
+        # small window of items is in flight at once, which keeps memory bounded when the consumer is slower.
+        if self.max_workers == 1:
+            for item in items:
+                yield func(item)
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    @metrics.timed("plex.sections", count_result=True)
     def _get_sections(self, section_type):
         try:
             sections = [section for section in self.library.sections() if section.type == section_type]
@@ -51,145 +154,298 @@ class PlexData(PlexServer):
             logger.critical(f"Failed to get sections of type {section_type} due to unexpected error: {e}")
             raise
 
-    def _movies(self) -> list:
-        movies = [movie for section in self._movie_sections for movie in section.all()]
-        logger.info(f"Retrieved {len(movies)} movies")
-        return movies
+    def _movies(self) -> Iterator:
+        return self._iter_sections(self._movie_sections, "movies")
+
+    def _shows(self) -> Iterator:
+        return self._iter_sections(self._shows_sections, "shows")
+
+    def _music(self) -> Iterator:
+        return self._iter_sections(self._music_sections, "music")
+
+    def _iter_sections(self, sections: list, label: str) -> Iterator:
+        count = 0
+        for section in sections:
+            for item in self.iter_section(section):
+                count += 1
+                yield item
+        logger.info(f"Retrieved {count} {label}")
+
+    def iter_section(self, section, libtype: str = None) -> Iterator:
+        """Yield the items of ``section`` one page of ``page_size`` at a time, as each page arrives.
+
+        Only one page of plexapi objects is held at once, and a failed page is retried on its own rather
+        than restarting the whole section.  With ``lean`` set the items are ``LeanItem``s instead.
+        """
+        libtype = libtype or section.TYPE
+        if self.lean:
+            fetch = partial(self._lean_page, f"/library/sections/{section.key}/all", {"type": searchType(libtype)})
+        else:
+            fetch = partial(self._search_page, section, libtype)
+        return self._iter_pages(fetch, f"section {section.title}")
+
+    def lean_items(self, key: str, params: dict = None) -> List[LeanItem]:
+        """Return every item listed at ``key`` as a ``LeanItem``, fetched with the unused fields left out."""
+        return list(self._iter_pages(partial(self._lean_page, key, params or {}), key))
+
+    def _iter_pages(self, fetch, label: str) -> Iterator:
+        container_start = 0
+        while True:
+            page = self._fetch_page(fetch, container_start, label)
+            container_start += len(page)
+            full_page = len(page) >= self.page_size
+            yield from self._release(page)
+            if not full_page:
+                return
+
+    def _fetch_page(self, fetch, container_start: int, label: str) -> list:
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer("plex.page") as counts:
+                    page = fetch(container_start)
+                    counts["items"] = len(page)
+                return page
+            except (RequestException, BadRequest) as e:
+                if attempt >= self.retries:
+                    logger.error(f"Page at {container_start} of {label} failed: {e}")
+                    raise
+                delay = self.backoff * 2**attempt
+                attempt += 1
+                metrics.increment("plex.page_retries")
+                logger.warning(
+                    f"Page at {container_start} of {label} failed: {e}. Retry {attempt}/{self.retries} in {delay}s"
+                )
+                time.sleep(delay)
+
+    def _search_page(self, section, libtype: str, container_start: int) -> list:
+        page = section.search(
+            libtype=libtype, container_start=container_start, container_size=self.page_size, maxresults=self.page_size
+        )
+        return list(page)
+
+    def _lean_page(self, key: str, params: dict, container_start: int) -> List[LeanItem]:
+        headers = {"X-Plex-Container-Start": str(container_start), "X-Plex-Container-Size": str(self.page_size)}
+        return parse_items(self, self.query(key, headers=headers, params={**params, **LEAN_PARAMS}))
+
+    def _compress_path(self, path: str) -> str:
+        # Movie paths arrive ";"-joined, and each one is compressed against its own root.
+        if self.path_roots is None:
+            return path
+        return self.path_roots.compress_joined(path)
 
-    def _shows(self) -> list:
-        shows = [show for section in self._shows_sections for show in section.all()]
-        logger.info(f"Retrieved {len(shows)} shows")
-        return shows
+    def _compress_paths(self, paths: list) -> list:
+        if self.path_roots is None:
+            return paths
+        return [self.path_roots.compress(path) for path in paths]
 
-    def _music(self) -> list:
-        music = [music for section in self._music_sections for music in section.all()]
-        logger.info(f"Retrieved {len(music)} music")
-        return music
+    @staticmethod
+    def _release(items: list) -> Iterator:
+        # Hand out items while dropping the list's reference to each one, so a plexapi object is freed as soon
+        # as its record has been built instead of when the whole page is done.
+        items.reverse()
+        while items:
+            yield items.pop()
 
     @property
     def get_movies_db(self) -> dict:
         if self._movies_db is None:
             self._movies_db = {}
             for movie in self._movies():
-                movie_title = movie.title or "empty"
-                movie_year = movie.year or "empty"
-                movie_thumb = movie.thumb or "empty"
-                movie_paths = movie.locations or "empty"
-                if movie_paths:
-                    movie_paths = str(";".join(movie.locations))
-
-                movie_name = self.NON_ALPHANUMERIC.sub("", movie.title).strip()
-                db = {
-                    "title": movie_title,
-                    "year": movie_year,
-                    "file_path": movie_paths,
-                    "thumb_path": movie_thumb,
-                }
-                self._movies_db[f"movie:{movie_name}:{movie.year}"] = db
-                logger.debug(f"Added movie {movie_title} to the database")
+                key, db = self._movie_record(movie)
+                self._movies_db[key] = db
+                logger.debug(f"Added movie {db['title']} to the database")
             logger.info("Generated movies database")
         return self._movies_db
 
+    def _movie_record(self, movie) -> Tuple[str, dict]:
+        movie_title = movie.title or "empty"
+        movie_year = movie.year or "empty"
+        movie_thumb = movie.thumb or "empty"
+        movie_paths = movie.locations or "empty"
+        if movie_paths:
+            movie_paths = self._compress_path(str(";".join(movie.locations)))
+
+        movie_name = self.NON_ALPHANUMERIC.sub("", movie.title).strip()
+        db = MovieRecord(movie_title, shared(movie_year), movie_paths, movie_thumb, self._added_at(movie))
+        return f"movie:{movie_name}:{movie.year}", db
+
     @property
     def get_shows_db(self) -> dict:
         if self._shows_db is None:
             self._shows_db = {}
-            for show in self._shows():
-                show_name = self.NON_ALPHANUMERIC.sub("", show.title).strip()
-                show_title = show.title or "empty"
-                show_year = show.year or "empty"
-                show_thumb = show.thumb or "empty"
-
-                db = {
-                    "title": show_title,
-                    "year": show_year,
-                    "thumb_path": show_thumb,
-                    "show_location": show.locations[0],
-                    # _get_episodes returns a dict.  Redis will not take a dict as a
-                    # value and so the dict needs to be serialized.
-                    "episodes": json.dumps(self._get_episodes(show)),
-                }
-
-                self._shows_db[f"movie:{show_name}:{show.year}"] = db
-                logger.debug(f"Added show {show_title} to the database")
+            if self.bulk:
+                for section in self._shows_sections:
+                    self._prefetch_leaves(section)
+            for key, db in self._map_items(self._show_record, self._shows()):
+                self._shows_db[key] = db
+                logger.debug(f"Added show {db['title']} to the database")
         logger.info("Generated TV shows database")
         return self._shows_db
 
+    def _show_record(self, show) -> Tuple[str, dict]:
+        show_name = self.NON_ALPHANUMERIC.sub("", show.title).strip()
+        show_title = show.title or "empty"
+        show_year = show.year or "empty"
+        show_thumb = show.thumb or "empty"
+
+        db = ShowRecord(
+            show_title,
+            shared(show_year),
+            show_thumb,
+            self._compress_path(show.locations[0]),
+            self._added_at(show),
+            # Redis will not take the nested episodes dict as a value, so it is serialized.
+            self._encode_rows(episodes_payload, self._episode_rows(show)),
+        )
+        return f"movie:{show_name}:{show.year}", db
+
     def _get_episodes(self, show) -> dict:
-        if show.seasons():
-            episode_dict = {}
-            for season in show.seasons():
-                episode_dict[f"season:{season.seasonNumber}"] = {}
-                for episode in season.episodes():
-                    episode_dict[f"season:{season.seasonNumber}"][f"episode:{episode.episodeNumber}"] = {
-                        "episode_name": episode.title,
-                        "episode_filename": Path(episode.locations[0]).stem,
-                    }
-            return episode_dict
-        else:
-            return {}
+        return episodes_payload(self._episode_rows(show))
+
+    def _episode_rows(self, show) -> EpisodeRows:
+        with metrics.timer("plex.episodes") as counts:
+            bulk_episodes = self._bulk_leaves.get(str(show.librarySectionID))
+            if bulk_episodes is not None:
+                rows = bulk_episodes.get(show.ratingKey, [])
+            else:
+                rows = [(season.seasonNumber, self._season_rows(season.episodes())) for season in show.seasons()]
+            # The rows are grouped by season, so the episodes are counted explicitly.
+            counts["items"] = sum(len(episodes) for _, episodes in rows)
+            return rows
+
+    @staticmethod
+    def _season_rows(episodes) -> List[tuple]:
+        return [(episode.episodeNumber, episode.title, Path(episode.locations[0]).stem) for episode in episodes]
 
     @property
     def get_music_db(self) -> dict:
         if self._music_db is None:
             self._music_db = {}
-            for artist in self._music():
-                artist_title = artist.title or "empty"
-                artist_thumb = artist.thumb or "empty"
-                artist_name = self.NON_ALPHANUMERIC.sub("", artist_title).strip()
-                db = {
-                    "artist": artist_title,
-                    "thumb": artist_thumb,
-                    # _get_tracks returns a dict.  Redis will not take a dict as a
-                    # value and so the dict needs to be serialized.
-                    "tracks": json.dumps(self._get_tracks(artist)),
-                }
-                self._music_db[f"artist:{artist_name}"] = db
-                logger.debug(f"Added artist {artist_title} to the database")
+            if self.bulk:
+                for section in self._music_sections:
+                    self._prefetch_leaves(section)
+            for key, db in self._map_items(self._artist_record, self._music()):
+                self._music_db[key] = db
+                logger.debug(f"Added artist {db['artist']} to the database")
         logger.info("Generated music database")
         return self._music_db
 
-    def _get_tracks(self, artist) -> dict:
-        if artist.albums():
-            track_db = {}
-            for album in artist.albums():
-                for track in album.tracks():
-                    track_number = track.trackNumber or "empty"
-                    track_name = track.title or "empty"
-                    track_location = track.locations or "empty"
-                    track_db[f"{album.title}:{album.year}"] = {
-                        "track_number": track_number,
-                        "track_name": track_name,
-                        "track_location": track_location,
-                    }
-            return track_db
-        else:
-            return {}
+    def _artist_record(self, artist) -> Tuple[str, dict]:
+        artist_title = artist.title or "empty"
+        artist_thumb = artist.thumb or "empty"
+        artist_name = self.NON_ALPHANUMERIC.sub("", artist_title).strip()
+        db = ArtistRecord(
+            artist_title,
+            artist_thumb,
+            self._added_at(artist),
+            # Redis will not take the nested tracks dict as a value, so it is serialized.
+            self._encode_rows(tracks_payload, self._track_rows(artist)),
+        )
+        return f"artist:{artist_name}", db
+
+    @metrics.timed("plex.tracks", count_result=True)
+    def _track_rows(self, artist) -> TrackRows:
+        bulk_tracks = self._bulk_leaves.get(str(artist.librarySectionID))
+        if bulk_tracks is not None:
+            return bulk_tracks.get(artist.ratingKey, [])
+        return [self._track_row(album, track) for album in artist.albums() for track in album.tracks()]
+
+    def _track_row(self, album, track) -> tuple:
+        return (
+            f"{album.title}:{album.year}",
+            track.trackNumber or "empty",
+            track.title or "empty",
+            self._compress_paths(track.locations) or "empty",
+        )
+
+    def _encode_rows(self, build, rows: list):
+        if self._serializer is not None:
+            return self._serializer.encode(build, rows)
+        return self._encode(build(rows))
+
+    def close(self) -> None:
+        """Stop the serialization processes, if any were started, and drop the shared record values."""
+        if self._serializer is not None:
+            self._serializer.close()
+        clear_shared()
+
+    def _prefetch_leaves(self, section) -> None:
+        if section.TYPE == "show":
+            self._bulk_leaves[str(section.key)] = self._bulk_episodes(section)
+        elif section.TYPE == "artist":
+            self._bulk_leaves[str(section.key)] = self._bulk_tracks(section)
+
+    def _bulk_episodes(self, section) -> Dict[int, EpisodeRows]:
+        # Seasons are fetched as well so that seasons without episodes still appear, exactly as the
+        # per-show crawl in _episode_rows reports them.
+        seasons = list(self.iter_section(section, "season"))
+        episodes = list(self.iter_section(section, "episode"))
+        logger.info(f"Retrieved {len(seasons)} seasons and {len(episodes)} episodes from section {section.title}")
 
-    def compile_libraries(self, movies=False, shows=False, music=False, db_slice: slice = None) -> dict:
+        seasons_by_show = defaultdict(list)
+        for season in seasons:
+            seasons_by_show[season.parentRatingKey].append(season)
+        episodes_by_season = defaultdict(list)
+        for episode in episodes:
+            episodes_by_season[episode.parentRatingKey].append(episode)
+
+        episodes_db = {}
+        for show_key, show_seasons in seasons_by_show.items():
+            episodes_db[show_key] = [
+                (
+                    season.seasonNumber,
+                    self._season_rows(sorted(episodes_by_season[season.ratingKey], key=self._index_order)),
+                )
+                for season in sorted(show_seasons, key=self._index_order)
+            ]
+        return episodes_db
+
+    def _bulk_tracks(self, section) -> Dict[int, TrackRows]:
+        # Artist.albums() is this same album search filtered by artist, so the section's album order
+        # matches the per-artist order used by _track_rows.
+        albums = list(self.iter_section(section, "album"))
+        tracks = list(self.iter_section(section, "track"))
+        logger.info(f"Retrieved {len(albums)} albums and {len(tracks)} tracks from section {section.title}")
+
+        tracks_by_album = defaultdict(list)
+        for track in tracks:
+            tracks_by_album[track.parentRatingKey].append(track)
+
+        tracks_db = defaultdict(list)
+        for album in albums:
+            tracks_db[album.parentRatingKey] += [
+                self._track_row(album, track)
+                for track in sorted(tracks_by_album[album.ratingKey], key=self._track_order)
+            ]
+        return dict(tracks_db)
+
+    @staticmethod
+    def _index_order(item) -> tuple:
+        return (item.index is None, item.index or 0)
+
+    @staticmethod
+    def _track_order(track) -> tuple:
+        return (track.parentIndex is None, track.parentIndex or 0, track.index is None, track.index or 0)
+
+    @metrics.timed("plex.compile", count_result=True)
+    def compile_libraries(
+        self, movies=False, shows=False, music=False, db_slice: slice = None, snapshot: SnapshotCache = None
+    ) -> dict:
         libraries_db = {}
         try:
-            if movies:
-                if db_slice:
-                    libraries_db.update({k: self.get_movies_db[k] for k in list(self.get_movies_db.keys())[db_slice]})
-                    logger.debug(f"Added movies to libraries with slice: {db_slice}")
-                else:
-                    libraries_db.update(self.get_movies_db)
-                    logger.debug("Added movies to libraries")
-            if shows:
-                if db_slice:
-                    libraries_db.update({k: self.get_shows_db[k] for k in list(self.get_shows_db.keys())[db_slice]})
-                    logger.debug(f"Added shows to libraries with slice: {db_slice}")
-                else:
-                    libraries_db.update(self.get_shows_db)
-                    logger.debug("Added shows to libraries")
-            if music:
+            for library, enabled in (("movies", movies), ("shows", shows), ("music", music)):
+                if not enabled:
+                    continue
+                library_db = self._library_db(library, snapshot)
                 if db_slice:
-                    libraries_db.update({k: self.get_music_db[k] for k in list(self.get_music_db.keys())[db_slice]})
-                    logger.debug(f"Added music to libraries with slice: {db_slice}")
+                    libraries_db.update({k: library_db[k] for k in list(library_db.keys())[db_slice]})
+                    logger.debug(f"Added {library} to libraries with slice: {db_slice}")
                 else:
-                    libraries_db.update(self.get_music_db)
-                    logger.debug("Added music to libraries")
+                    libraries_db.update(library_db)
+                    logger.debug(f"Added {library} to libraries")
+            if self.path_roots is not None and libraries_db:
+                libraries_db[PATH_ROOTS_KEY] = self.path_roots.to_record()
 
             logger.info("Libraries packaged")
             return libraries_db
@@ -202,3 +458,303 @@ class PlexData(PlexServer):
         except Exception as e:
             logger.critical(f"Failed to package libraries due to unexpected error: {e}")
             raise
+
+    def _library_db(self, library: str, snapshot: SnapshotCache = None) -> dict:
+        if snapshot is not None:
+            return dict(self.iter_libraries(**{library: True}, snapshot=snapshot))
+        if library == "movies":
+            return self.get_movies_db
+        if library == "shows":
+            return self.get_shows_db
+        return self.get_music_db
+
+    def iter_libraries(
+        self, movies=False, shows=False, music=False, normalized=False, snapshot: SnapshotCache = None
+    ) -> Iterator[Tuple[str, dict]]:
+        """Lazily yield ``(key, mapping)`` records section by section.
+
+        Unlike ``compile_libraries`` nothing is accumulated, so records can be written to Redis while the
+        rest of the library is still being harvested.  With ``normalized`` set, shows and artists are split
+        into per-season and per-album hashes linked by sorted-set indexes.  With a ``snapshot``, fresh
+        sections are read back from disk and the others are harvested and stored as they stream past.
+        """
+        if normalized:
+            sections = self._normalized_sections(movies, shows, music)
+        else:
+            sections = [
+                (section, lambda item, make_record=make_record: [make_record(item)])
+                for section, make_record in self._record_sections(movies, shows, music)
+            ]
+        try:
+            if self.path_roots is not None and sections:
+                yield PATH_ROOTS_KEY, self.path_roots.to_record()
+            for section, make_records in sections:
+                if snapshot is not None:
+                    snapshot_id = self._snapshot_id(section, normalized)
+                    if snapshot.is_fresh(snapshot_id, section.updatedAt):
+                        logger.info(f"Loading section {section.title} from the snapshot cache")
+                        yield from snapshot.load(snapshot_id)
+                        continue
+                    records = self._harvest_section(section, make_records, normalized)
+                    path_roots = self.path_roots.to_record() if self.path_roots is not None else None
+                    yield from snapshot.store(snapshot_id, records, path_roots)
+                else:
+                    yield from self._harvest_section(section, make_records, normalized)
+        except BadRequest as e:
+            logger.error(f"Failed to stream libraries due to bad request: {e}")
+            raise
+        except NotFound as e:
+            logger.error(f"Failed to stream libraries due to resource not found: {e}")
+            raise
+        except Exception as e:
+            logger.critical(f"Failed to stream libraries due to unexpected error: {e}")
+            raise
+
+    def _harvest_section(self, section, make_records, normalized=False) -> Iterator[Tuple[str, dict]]:
+        # Normalized albums are crawled per artist, so only episodes benefit from the bulk fetch.
+        if self.bulk and not (normalized and section.TYPE == "artist"):
+            self._prefetch_leaves(section)
+        count = 0
+        for records in self._imap_items(make_records, self.iter_section(section)):
+            count += 1
+            yield from records
+        self._bulk_leaves.pop(str(section.key), None)
+        logger.info(f"Streamed {count} items from section {section.title}")
+
+    def _snapshot_id(self, section, normalized=False) -> str:
+        # Cached records are only reusable with the same layout, codec and path roots they were built with.
+        layout = "normalized" if normalized else "flat"
+        compression = "" if self.codec.compress_threshold is None else f"+z{self.codec.compress_threshold}"
+        if self.path_roots is not None:
+            compression += f"+p{self.path_roots.fingerprint()}"
+        return f"{section.uuid}:{layout}:{self.codec.name}{compression}"
+
+    def _normalized_sections(self, movies=False, shows=False, music=False) -> list:
+        sections = [
+            (section, lambda item: [self._movie_record(item)]) for section, _ in self._record_sections(movies=movies)
+        ]
+        if shows:
+            sections += [(section, self._normalized_show_records) for section in self._shows_sections]
+        if music:
+            sections += [(section, self._normalized_artist_records) for section in self._music_sections]
+        return sections
+
+    def _normalized_show_records(self, show) -> List[Tuple[str, dict]]:
+        show_key = f"show:{show.ratingKey}"
+        db = {
+            "title": show.title or "empty",
+            "year": show.year or "empty",
+            "thumb_path": show.thumb or "empty",
+            "show_location": self._compress_path(show.locations[0]),
+            "added_at": self._added_at(show),
+        }
+        records = [(show_key, db)]
+        seasons = SortedSetRecord()
+        for season_name, episodes in self._get_episodes(show).items():
+            season_key = f"{show_key}:{season_name}"
+            seasons[season_key] = self._index_score(season_name.split(":", 1)[1])
+            records.append((season_key, {episode: self._encode(data) for episode, data in episodes.items()}))
+        records.append((f"{show_key}:seasons", seasons))
+        return records
+
+    def _normalized_artist_records(self, artist) -> List[Tuple[str, dict]]:
+        artist_key = f"artist:{artist.ratingKey}"
+        db = {
+            "artist": artist.title or "empty",
+            "thumb": artist.thumb or "empty",
+            "added_at": self._added_at(artist),
+        }
+        records = [(artist_key, db)]
+        albums = SortedSetRecord()
+        for album in artist.albums():
+            album_key = f"{artist_key}:album:{album.ratingKey}"
+            albums[album_key] = self._index_score(album.year)
+            album_db = {"title": album.title or "empty", "year": album.year or "empty"}
+            for track in album.tracks():
+                # Keyed by rating key, as disc and track numbers are often missing and would collide.
+                album_db[f"track:{track.ratingKey}"] = self._encode(
+                    {
+                        "disc_number": track.parentIndex or 1,
+                        "track_number": track.trackNumber or "empty",
+                        "track_name": track.title or "empty",
+                        "track_location": self._compress_paths(track.locations) or "empty",
+                    }
+                )
+            records.append((album_key, album_db))
+        records.append((f"{artist_key}:albums", albums))
+        return records
+
+    @staticmethod
+    def _added_at(item):
+        return int(item.addedAt.timestamp()) if item.addedAt else "empty"
+
+    @staticmethod
+    def _index_score(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _record_sections(self, movies=False, shows=False, music=False) -> list:
+        sections = []
+        if movies:
+            sections += [(section, self._movie_record) for section in self._movie_sections]
+        if shows:
+            sections += [(section, self._show_record) for section in self._shows_sections]
+        if music:
+            sections += [(section, self._artist_record) for section in self._music_sections]
+        return sections
+
+    def compile_changes(
+        self, sync_state: SyncState, movies=False, shows=False, music=False, full=False
+    ) -> Tuple[dict, List[str]]:
+        """Return the records added or updated since the last sync and the keys of records that vanished.
+
+        Each section is tracked by its own watermark in ``sync_state``.  A section without a watermark, or any
+        section when ``full`` is set, is harvested completely.  Shows and artists are also rebuilt when their
+        episode or track count changes, as deleting a leaf does not touch the parent's timestamps.  The path
+        roots table is only included when it differs from the one recorded in ``sync_state``, and every section
+        is harvested again when a root the synced records may use was dropped.  The caller is expected to save
+        ``sync_state`` once the changes have been written to Redis.
+        """
+        sections = self._record_sections(movies, shows, music)
+        path_roots = self.path_roots.to_record() if self.path_roots is not None else {}
+        known_roots = sync_state.path_roots()
+        if known_roots.items() - path_roots.items():
+            logger.info("Library roots changed since the last sync. Every section will be harvested again.")
+            full = True
+        changes_db = {}
+        removed_keys = []
+        try:
+            for section, make_record in sections:
+                items, section_keys, current_rating_keys, section_state = self._section_changes(
+                    sync_state, section, full
+                )
+                known_keys = sync_state.keys(section.uuid)
+                for item, (key, db) in zip(items, self._map_items(make_record, items)):
+                    rating_key = str(item.ratingKey)
+                    changes_db[key] = db
+                    section_keys[rating_key] = key
+                    if known_keys.get(rating_key, key) != key:
+                        removed_keys.append(known_keys[rating_key])
+
+                removed_keys += [v for k, v in known_keys.items() if k not in current_rating_keys]
+                sync_state.update(section.uuid, keys=section_keys, **section_state)
+                logger.info(
+                    f"Section {section.title}: {len(items)} changed, "
+                    f"{len(known_keys.keys() - current_rating_keys)} removed"
+                )
+
+            if path_roots != known_roots or (full and path_roots):
+                changes_db[PATH_ROOTS_KEY] = path_roots
+                sync_state.update_path_roots(path_roots)
+            removed_keys = [key for key in dict.fromkeys(removed_keys) if key not in changes_db]
+            logger.info(f"Changes packaged: {len(changes_db)} updated, {len(removed_keys)} removed")
+            return changes_db, removed_keys
+        except BadRequest as e:
+            logger.error(f"Failed to package changes due to bad request: {e}")
+            raise
+        except NotFound as e:
+            logger.error(f"Failed to package changes due to resource not found: {e}")
+            raise
+        except Exception as e:
+            logger.critical(f"Failed to package changes due to unexpected error: {e}")
+            raise
+
+    def _section_changes(self, sync_state: SyncState, section, full=False) -> Tuple[list, dict, set, dict]:
+        # Returns the items to rebuild, the known keys that are still current, the rating keys in the section and
+        # the section's next watermark, leaf counts and watermark keys for ``sync_state``.
+        watermark = None if full else sync_state.watermark(section.uuid)
+        has_leaves = section.TYPE in self.LEAF_TYPES
+        if watermark is None:
+            if self.bulk:
+                self._prefetch_leaves(section)
+            items = list(self.iter_section(section))
+            section_watermark = self._latest_timestamp(items)
+            section_state = {
+                "watermark": section_watermark,
+                "leaf_counts": self._section_leaf_counts(section) if has_leaves else {},
+                "watermark_keys": self._keys_at(items, section_watermark),
+            }
+            return items, {}, {str(item.ratingKey) for item in items}, section_state
+
+        self._bulk_leaves.pop(str(section.key), None)
+        leaf_counts = self._section_leaf_counts(section)
+        # A show or artist whose episode or track count moved has had leaves deleted (or added), which the
+        # timestamp filters cannot see, so it is rebuilt as well.
+        known_counts = sync_state.leaf_counts(section.uuid)
+        stale_keys = [key for key, count in leaf_counts.items() if key in known_counts and known_counts[key] != count]
+        items, changed = self._changed_items(section, watermark, sync_state.watermark_keys(section.uuid), stale_keys)
+
+        section_watermark = max(watermark, self._latest_timestamp(changed))
+        watermark_keys = self._keys_at(changed, section_watermark)
+        if section_watermark == watermark:
+            watermark_keys |= sync_state.watermark_keys(section.uuid)
+        current_rating_keys = set(leaf_counts)
+        section_keys = {k: v for k, v in sync_state.keys(section.uuid).items() if k in current_rating_keys}
+        section_state = {
+            "watermark": section_watermark,
+            "leaf_counts": leaf_counts if has_leaves else {},
+            "watermark_keys": watermark_keys,
+        }
+        return items, section_keys, current_rating_keys, section_state
+
+    def _changed_items(self, section, watermark: int, watermark_keys: set, stale_keys: list) -> Tuple[list, list]:
+        # ">>" is strict and timestamps are whole seconds, so the search starts a second early to catch items changed
+        # in the same second as the last sync.  Those that the last sync already saw are recognised by rating key.
+        since = datetime.fromtimestamp(watermark - 1)
+        items = section.search(filters={"or": [{"addedAt>>": since}, {"updatedAt>>": since}]})
+        items = self._unsynced(items, watermark, watermark_keys)
+        changed = list(items)
+
+        # A new or edited episode or track does not bump its show or artist, so leaf changes are
+        # resolved up to their top level item.
+        parent_keys = set(stale_keys)
+        leaf_type = self.LEAF_TYPES.get(section.TYPE)
+        if leaf_type:
+            leaves = section.search(
+                libtype=leaf_type,
+                filters={"or": [{f"{leaf_type}.addedAt>>": since}, {f"{leaf_type}.updatedAt>>": since}]},
+            )
+            leaves = self._unsynced(leaves, watermark, watermark_keys)
+            changed += leaves
+            parent_keys |= {str(leaf.grandparentRatingKey) for leaf in leaves}
+        parent_keys -= {str(item.ratingKey) for item in items}
+        if parent_keys:
+            items += self.fetchItems([int(key) for key in parent_keys])
+        logger.debug(f"Retrieved {len(items)} changed items from section {section.title}")
+        return items, changed
+
+    def _unsynced(self, items, watermark: int, watermark_keys: set) -> list:
+        return [
+            item
+            for item in items
+            if str(item.ratingKey) not in watermark_keys or self._latest_timestamp([item]) > watermark
+        ]
+
+    def _keys_at(self, items, timestamp: int) -> set:
+        return {str(item.ratingKey) for item in items if timestamp and self._latest_timestamp([item]) == timestamp}
+
+    def _section_leaf_counts(self, section) -> Dict[str, int]:
+        """Map the rating key of every item in ``section`` to its number of episodes or tracks (0 for movies)."""
+        data = self.query(f"/library/sections/{section.key}/all?type={searchType(section.TYPE)}")
+        leaf_counts = {
+            elem.attrib["ratingKey"]: int(elem.attrib.get("leafCount", 0))
+            for elem in data
+            if "ratingKey" in elem.attrib
+        }
+        if section.TYPE == "artist":
+            # Artists do not carry a track count, but their albums do.
+            leaf_counts = dict.fromkeys(leaf_counts, 0)
+            albums = self.query(f"/library/sections/{section.key}/all?type={searchType('album')}")
+            for elem in albums:
+                if elem.attrib.get("parentRatingKey") in leaf_counts:
+                    leaf_counts[elem.attrib["parentRatingKey"]] += int(elem.attrib.get("leafCount", 0))
+        return leaf_counts
+
+    @staticmethod
+    def _latest_timestamp(items) -> int:
+        timestamps = [
+            int(stamp.timestamp()) for item in items for stamp in (item.addedAt, item.updatedAt) if stamp is not None
+        ]
+        return max(timestamps, default=0)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import List
+from xml.etree import ElementTree
+
+from plexapi.utils import searchType
+
+# Listing responses carry every tag, rating and summary of an item, none of which end up in a record.  Plex
+# drops these attributes and child elements server-side, and a server that ignores the parameters still
+# returns everything LeanItem reads.
+EXCLUDED_FIELDS = ("summary", "tagline", "art", "banner", "theme", "studio", "contentRating", "originalTitle")
+EXCLUDED_ELEMENTS = (
+    "Genre",
+    "Role",
+    "Director",
+    "Writer",
+    "Producer",
+    "Country",
+    "Collection",
+    "Label",
+    "Mood",
+    "Style",
+    "Similar",
+    "Guid",
+    "Rating",
+    "Image",
+    "Field",
+    "UltraBlurColors",
+)
+LEAN_PARAMS = {
+    "excludeFields": ",".join(EXCLUDED_FIELDS),
+    "excludeElements": ",".join(EXCLUDED_ELEMENTS),
+    "includeGuids": 0,
+}
+
+
+class LeanItem:
+    """The attributes of a library item that records are built from, read straight from the listing XML.
+
+    A stand-in for plexapi's Movie, Show, Season, Episode, Artist, Album and Track objects, which parse
+    dozens of attributes and build an object per tag.  Attribute names and types match plexapi's, so
+    ``PlexData`` builds the same records from either.  Children are fetched through the server, lean again.
+    """
+
+    __slots__ = (
+        "_server",
+        "type",
+        "ratingKey",
+        "parentRatingKey",
+        "grandparentRatingKey",
+        "librarySectionID",
+        "title",
+        "year",
+        "thumb",
+        "index",
+        "parentIndex",
+        "childCount",
+        "addedAt",
+        "updatedAt",
+        "locations",
+    )
+
+    def __init__(self, server, element: ElementTree.Element, section_id: int = None) -> None:
+        attrib = element.attrib
+        self._server = server
+        self.type = attrib.get("type")
+        self.ratingKey = _int(attrib.get("ratingKey"))
+        self.parentRatingKey = _int(attrib.get("parentRatingKey"))
+        self.grandparentRatingKey = _int(attrib.get("grandparentRatingKey"))
+        self.librarySectionID = _int(attrib.get("librarySectionID")) or section_id
+        self.title = attrib.get("title")
+        self.year = _int(attrib.get("year"))
+        self.thumb = attrib.get("thumb")
+        self.index = _int(attrib.get("index"))
+        self.parentIndex = _int(attrib.get("parentIndex"))
+        self.childCount = _int(attrib.get("childCount"))
+        self.addedAt = _datetime(attrib.get("addedAt"))
+        self.updatedAt = _datetime(attrib.get("updatedAt"))
+        # Shows list their folders, while movies, episodes and tracks list the files of their media parts.
+        self.locations = [location.get("path") for location in element.findall("Location")] or [
+            part.get("file") for part in element.iterfind("Media/Part") if part.get("file")
+        ]
+
+    @property
+    def seasonNumber(self):
+        return self.index
+
+    @property
+    def episodeNumber(self):
+        return self.index
+
+    @property
+    def trackNumber(self):
+        return self.index
+
+    def seasons(self) -> List["LeanItem"]:
+        return self._server.lean_items(f"/library/metadata/{self.ratingKey}/children", {"excludeAllLeaves": 1})
+
+    def episodes(self) -> List["LeanItem"]:
+        return self._server.lean_items(f"/library/metadata/{self.ratingKey}/children")
+
+    def albums(self) -> List["LeanItem"]:
+        # The same album search as plexapi's Artist.albums(), so albums come back in the same order.
+        return self._server.lean_items(
+            f"/library/sections/{self.librarySectionID}/all", {"type": searchType("album"), "artist.id": self.ratingKey}
+        )
+
+    def tracks(self) -> List["LeanItem"]:
+        return self._server.lean_items(f"/library/metadata/{self.ratingKey}/children")
+
+    def __repr__(self) -> str:
+        return f"<LeanItem {self.type}:{self.ratingKey}:{self.title}>"
+
+
+def parse_items(server, container: ElementTree.Element) -> List[LeanItem]:
+    if container is None:
+        return []
+    section_id = _int(container.get("librarySectionID"))
+    return [LeanItem(server, element, section_id) for element in container if "ratingKey" in element.attrib]
+
+
+def _int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def _datetime(value):
+    return datetime.fromtimestamp(int(value)) if value not in (None, "") else None
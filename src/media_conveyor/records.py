@@ -0,0 +1,72 @@
+from collections.abc import Mapping
+from typing import Tuple
+
+# Years and other small numbers repeat across a whole library, so records share one object per value.  The
+# table is capped so that a long-lived process never grows it without bound, and cleared when a harvest closes.
+_SHARED_VALUES = {}
+SHARED_VALUES_LIMIT = 4096
+
+
+def shared(value):
+    if len(_SHARED_VALUES) >= SHARED_VALUES_LIMIT:
+        return _SHARED_VALUES.get(value, value)
+    return _SHARED_VALUES.setdefault(value, value)
+
+
+def clear_shared() -> None:
+    _SHARED_VALUES.clear()
+
+
+class SortedSetRecord(dict):
+    """A ``member -> score`` mapping that is written to Redis as a sorted set rather than a hash."""
+
+
+class MediaRecord(Mapping):
+    """A read-only hash record with a fixed set of fields, stored in slots rather than a per-record dict.
+
+    Records behave as mappings, so they can be written, digested and cached anywhere a dict record can.
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, *values) -> None:
+        if len(values) != len(self.FIELDS):
+            raise ValueError(f"{type(self).__name__} takes {len(self.FIELDS)} values, got {len(values)}")
+        for field, value in zip(self.FIELDS, values):
+            object.__setattr__(self, field, value)
+
+    def __getitem__(self, field: str):
+        if field in self.FIELDS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __contains__(self, field) -> bool:
+        return field in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, field) for field in self.FIELDS)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class MovieRecord(MediaRecord):
+    __slots__ = FIELDS = ("title", "year", "file_path", "thumb_path", "added_at")
+
+
+class ShowRecord(MediaRecord):
+    __slots__ = FIELDS = ("title", "year", "thumb_path", "show_location", "added_at", "episodes")
+
+
+class ArtistRecord(MediaRecord):
+    __slots__ = FIELDS = ("artist", "thumb", "added_at", "tracks")
@@ -1,38 +1,821 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
-from typing import Dict
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from redis import ConnectionError, RedisError, StrictRedis, TimeoutError
+from redis import BlockingConnectionPool, ConnectionError, RedisError, StrictRedis, TimeoutError
 
 from .logging import setup_logger
+from .metrics import metrics
+from .paths import PATH_ROOTS_KEY, PathRoots
+from .records import SortedSetRecord
+from .state import UploadCheckpoint
+from .value_codecs import ValueCodec, decode_value
 
 logger = setup_logger()
 
 
 class RedisPlexDB(StrictRedis):
+    DEFAULT_CHUNK_SIZE = 500
+    DEFAULT_RETRIES = 3
+    DEFAULT_BACKOFF = 1.0
+    SCAN_COUNT = 1000
+    VERSION_COUNTER_KEY = "meta:version_counter"
+    CURRENT_VERSION_KEY = "meta:current_version"
+    PENDING_VERSION_KEY = "meta:pending_version"
+    # Relative to the version prefix, so every version carries its own index.
+    DIGEST_INDEX_KEY = "meta:digests"
+    # Secondary indexes, also relative to the version prefix.  Title entries are "<lowercase title>\x00<key>"
+    # members of a single-score sorted set so that ZRANGEBYLEX can answer prefix queries.
+    TITLE_INDEX_KEY = "idx:title"
+    TITLE_MEMBERS_KEY = "idx:title_members"
+    YEAR_INDEX_KEY = "idx:year"
+    ADDED_INDEX_KEY = "idx:added"
+    TYPE_INDEX_KEY = "idx:type:{}"
+    MEDIA_TYPES = ("movie", "show", "artist")
+    # Flat-layout shows are stored under "movie:" keys, so they are found by scanning both patterns.
+    MEDIA_TYPE_PATTERNS = {"movie": ("movie:*",), "show": ("show:*", "movie:*"), "artist": ("artist:*",)}
+    INTERNAL_PREFIXES = ("meta:", "idx:")
+    VERSIONED_KEY = re.compile(r"^v\d+:")
+    # Key patterns written before uploads were versioned.
+    LEGACY_PATTERNS = ("movie:*", "show:*", "artist:*", "idx:*", DIGEST_INDEX_KEY, PATH_ROOTS_KEY)
+    # Fields holding codec-encoded payloads rather than plain strings.  The prefixes cover the per-episode and
+    # per-track fields of the normalized layout.
+    PAYLOAD_FIELDS = ("episodes", "tracks")
+    PAYLOAD_FIELD_PREFIXES = ("episode:", "track:")
+    BINARY_VALUES_ERROR = (
+        "Records hold binary codec values that this client cannot decode as text. "
+        "Read them through a RedisPlexDB created with decode_responses=False."
+    )
+    # The previous title entry of a record has to be removed when its title changes, so the title lookup and
+    # the index updates run server-side and stay in the same pipeline as the record itself.
+    INDEX_SCRIPT = """
+        local previous = redis.call('HGET', KEYS[2], ARGV[1])
+        if previous and previous ~= ARGV[2] then
+            redis.call('ZREM', KEYS[1], previous)
+        end
+        redis.call('ZADD', KEYS[1], 0, ARGV[2])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+        for i = 3, 4 do
+            if ARGV[i] ~= '' then
+                redis.call('ZADD', KEYS[i], ARGV[i], ARGV[1])
+            else
+                redis.call('ZREM', KEYS[i], ARGV[1])
+            end
+        end
+        redis.call('SADD', KEYS[5], ARGV[1])
+    """
+    UNINDEX_SCRIPT = """
+        local previous = redis.call('HGET', KEYS[2], ARGV[1])
+        if previous then
+            redis.call('ZREM', KEYS[1], previous)
+            redis.call('HDEL', KEYS[2], ARGV[1])
+        end
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        redis.call('ZREM', KEYS[4], ARGV[1])
+        for i = 5, #KEYS do
+            redis.call('SREM', KEYS[i], ARGV[1])
+        end
+    """
     plex_db: Dict[str, str]
 
     def __init__(
-        self, plex_db: Dict[str, str] = None, host: str = "localhost", port: int = 9000, decode_responses: bool = True
+        self,
+        plex_db: Dict[str, str] = None,
+        host: str = "localhost",
+        port: int = 9000,
+        decode_responses: bool = None,
+        indexes: bool = False,
+        max_connections: int = None,
+        codec: ValueCodec = None,
     ) -> None:
+        """``decode_responses`` defaults to True, or to False when ``codec`` writes binary values.
+
+        Values of binary codecs can only be read back through a client created with ``decode_responses=False``,
+        so combining one with ``decode_responses=True`` is rejected.
+        """
         if not host:
             raise ValueError("Host must be provided")
         if not isinstance(port, int) or port <= 0:
             raise ValueError("Port must be a positive integer")
         if plex_db is not None and (not isinstance(plex_db, dict) or not plex_db):
             raise ValueError("plex_db must be a non-empty dictionary")
+        if max_connections is not None and (not isinstance(max_connections, int) or max_connections <= 0):
+            raise ValueError("max_connections must be a positive integer")
+        binary = codec is not None and codec.binary
+        if decode_responses is None:
+            decode_responses = not binary
+        elif decode_responses and binary:
+            raise ValueError(f"The {codec.name} codec writes binary values, which need decode_responses=False")
 
-        super().__init__(host=host, port=port, decode_responses=decode_responses)
+        if max_connections is None:
+            super().__init__(host=host, port=port, decode_responses=decode_responses)
+        else:
+            # A blocking pool makes callers wait for a free connection instead of failing when it is exhausted.
+            pool = BlockingConnectionPool(
+                host=host, port=port, decode_responses=decode_responses, max_connections=max_connections
+            )
+            super().__init__(connection_pool=pool)
+        self.max_connections = max_connections
         self.plex_db = plex_db if plex_db is not None else {}
+        self.reclaim_thread: Optional[threading.Thread] = None
+        self.indexes = indexes
+        self.codec = codec
+        self._index_script = self.register_script(self.INDEX_SCRIPT)
+        self._unindex_script = self.register_script(self.UNINDEX_SCRIPT)
+
+    @metrics.timed("redis.make_db")
+    def make_db(
+        self,
+        removed_keys: Iterable[str] = None,
+        chunk_size: int = None,
+        transaction: bool = True,
+        checkpoint: UploadCheckpoint = None,
+        pipelines: int = 1,
+    ) -> None:
+        self.write_records(self.plex_db.items(), removed_keys, chunk_size, transaction, checkpoint, pipelines=pipelines)
+        logger.info("Database created successfully")
+
+    def write_records(
+        self,
+        records: Iterable[Tuple[str, dict]],
+        removed_keys: Iterable[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        transaction: bool = True,
+        checkpoint: UploadCheckpoint = None,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        key_prefix: str = None,
+        pipelines: int = 1,
+    ) -> int:
+        """Write ``(key, mapping)`` records, executing the pipeline every ``chunk_size`` records.
+
+        ``records`` may be a generator; it is consumed lazily so only one chunk is buffered at a time.  A
+        ``chunk_size`` of None sends everything in a single pipeline.  A chunk that fails on a connection
+        error or timeout is retried with exponential backoff.  With a ``checkpoint`` the offset of every
+        committed chunk is recorded, and a later call with the same records skips what was already written.
+        Keys are written under ``key_prefix``, which defaults to the prefix of the live version.  With
+        ``pipelines`` above one, that many chunks are executed at once on separate connections.
+        """
+        self._validate_chunk_size(chunk_size)
+        self._validate_pipelines(pipelines)
+        skip = checkpoint.offset if checkpoint else 0
+        progress = {"written": 0, "chunks": 0}
+        chunk = []
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            removed_keys = [f"{key_prefix}{key}" for key in removed_keys or []]
+            with self._pipeline_window(pipelines) as submit:
+                for offset, key_id, value_data in self._skip_checkpointed(records, checkpoint):
+                    chunk.append((f"{key_prefix}{key_id}", value_data))
+                    if chunk_size and len(chunk) >= chunk_size:
+                        submit(
+                            (chunk, removed_keys, transaction, retries, backoff, key_prefix),
+                            partial(self._chunk_written, progress, len(chunk), checkpoint, offset, key_id),
+                        )
+                        removed_keys = []
+                        chunk = []
+                if chunk or removed_keys:
+                    submit(
+                        (chunk, removed_keys, transaction, retries, backoff, key_prefix),
+                        partial(self._chunk_written, progress, len(chunk)),
+                    )
+            if checkpoint:
+                checkpoint.clear()
+            logger.info(
+                f"Wrote {progress['written']} records in {progress['chunks']} pipelines "
+                f"({skip} skipped from checkpoint)"
+            )
+            return progress["written"]
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+
+    @staticmethod
+    def _chunk_written(
+        progress: dict, length: int, checkpoint: UploadCheckpoint = None, offset: int = None, key_id: str = None
+    ) -> None:
+        progress["written"] += length
+        progress["chunks"] += 1
+        if checkpoint and offset is not None:
+            checkpoint.commit(offset, key_id)
+        logger.debug(f"Wrote chunk {progress['chunks']} ({progress['written']} records so far)")
+
+    def _validate_pipelines(self, pipelines: int) -> None:
+        if not isinstance(pipelines, int) or pipelines <= 0:
+            raise ValueError("pipelines must be a positive integer")
+        if self.max_connections is not None and pipelines > self.max_connections:
+            raise ValueError("pipelines cannot exceed max_connections")
+
+    @contextmanager
+    def _pipeline_window(self, pipelines: int):
+        """Yield a ``submit(chunk_args, on_done=None)`` function that executes chunks up to ``pipelines`` at a time.
+
+        ``on_done`` callbacks run on the calling thread in submission order, so a checkpoint never records a
+        chunk as committed while an earlier one may still fail.  Submitting blocks once ``pipelines`` chunks
+        are in flight, which keeps a fast producer from buffering the whole library.
+        """
+        if pipelines == 1:
+
+            def run(chunk_args, on_done=None):
+                self._execute_chunk(*chunk_args)
+                if on_done is not None:
+                    on_done()
+
+            yield run
+            return
+        pending = deque()
+
+        def drain(limit):
+            while len(pending) > limit:
+                future, on_done = pending.popleft()
+                future.result()
+                if on_done is not None:
+                    on_done()
+
+        def submit(chunk_args, on_done=None):
+            pending.append((executor.submit(self._execute_chunk, *chunk_args), on_done))
+            drain(pipelines - 1)
+
+        with ThreadPoolExecutor(max_workers=pipelines, thread_name_prefix="redis-pipeline") as executor:
+            yield submit
+            drain(0)
+
+    @staticmethod
+    def _validate_chunk_size(chunk_size: Optional[int]) -> None:
+        if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size <= 0):
+            raise ValueError("chunk_size must be a positive integer")
+
+    @staticmethod
+    def _skip_checkpointed(records, checkpoint: UploadCheckpoint = None) -> Iterator[Tuple[int, str, dict]]:
+        skip, last_key = (checkpoint.offset, checkpoint.last_key) if checkpoint else (0, None)
+        offset = 0
+        for offset, (key_id, value_data) in enumerate(records, start=1):
+            if offset < skip:
+                continue
+            if offset == skip:
+                if key_id != last_key:
+                    checkpoint.clear()
+                    raise ValueError(
+                        f"Checkpoint expected key {last_key} at offset {skip} but found {key_id}. "
+                        "The checkpoint has been cleared; run the upload again to start from the beginning."
+                    )
+                continue
+            yield offset, key_id, value_data
+        if offset < skip:
+            # The records ran out before the checkpoint, so they are not the ones it was taken against.
+            checkpoint.clear()
+            raise ValueError(
+                f"Checkpoint expected key {last_key} at offset {skip} but there are only {offset} records. "
+                "The checkpoint has been cleared; run the upload again to start from the beginning."
+            )
+
+    def diff_db(
+        self,
+        records: Iterable[Tuple[str, dict]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        transaction: bool = True,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        key_prefix: str = None,
+        pipelines: int = 1,
+    ) -> Dict[str, int]:
+        """Write only the records whose digest differs from the digest index, and delete vanished keys.
+
+        ``records`` must be the complete library, since any indexed key not among them is removed.  Digests
+        are updated in the same pipeline as their records, so an interrupted run simply resumes where it
+        stopped on the next call.  Records whose key went missing from Redis are written again even though
+        their digest matches.  Returns the count of added, changed, restored, removed and unchanged records.
+        ``pipelines`` works as it does for ``write_records``.
+        """
+        self._validate_chunk_size(chunk_size)
+        self._validate_pipelines(pipelines)
+        counts = {"added": 0, "changed": 0, "restored": 0, "removed": 0, "unchanged": 0}
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            digest_index = f"{key_prefix}{self.DIGEST_INDEX_KEY}"
+            known_digests = self._load_digests(digest_index)
+            logger.info(f"Loaded {len(known_digests)} digests from {digest_index}")
+
+            seen_keys = set()
+            chunk = []
+            digests = {}
+            with self._pipeline_window(pipelines) as submit:
+                changed_records = self._changed_records(
+                    records, key_prefix, known_digests, seen_keys, counts, chunk_size or self.DEFAULT_CHUNK_SIZE
+                )
+                for key_id, value_data, digest in changed_records:
+                    chunk.append((key_id, value_data))
+                    digests[key_id] = digest
+                    if chunk_size and len(chunk) >= chunk_size:
+                        submit((chunk, [], transaction, retries, backoff, key_prefix, digest_index, digests))
+                        chunk = []
+                        digests = {}
+
+                removed_keys = [key for key in known_digests if key not in seen_keys]
+                counts["removed"] = len(removed_keys)
+                if chunk or removed_keys:
+                    submit((chunk, removed_keys, transaction, retries, backoff, key_prefix, digest_index, digests))
+
+            logger.info(
+                "Diff complete: {added} added, {changed} changed, {restored} restored, {removed} removed, "
+                "{unchanged} unchanged".format(**counts)
+            )
+            return counts
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+
+    def _load_digests(self, digest_index: str) -> Dict[str, str]:
+        # A client built for a binary codec does not decode responses, so the keys and digests are decoded here to
+        # compare with the str keys and hex digests of the incoming records.
+        return {
+            (key.decode("utf-8") if isinstance(key, bytes) else key): (
+                digest.decode("utf-8") if isinstance(digest, bytes) else digest
+            )
+            for key, digest in self.hscan_iter(digest_index, count=self.SCAN_COUNT)
+        }
+
+    def _changed_records(
+        self, records, key_prefix: str, known_digests: dict, seen_keys: set, counts: dict, check_size: int
+    ) -> Iterator[Tuple[str, dict, str]]:
+        # Yields (key, record, digest) for every record that has to be written, counting the rest as unchanged.
+        unchanged = []
+        for key_id, value_data in records:
+            key_id = f"{key_prefix}{key_id}"
+            seen_keys.add(key_id)
+            digest = self.record_digest(value_data)
+            previous_digest = known_digests.get(key_id)
+            if previous_digest != digest:
+                counts["added" if previous_digest is None else "changed"] += 1
+                yield key_id, value_data, digest
+                continue
+            unchanged.append((key_id, value_data, digest))
+            if len(unchanged) >= check_size:
+                yield from self._missing_records(unchanged, counts)
+                unchanged = []
+        yield from self._missing_records(unchanged, counts)
+
+    def _missing_records(self, unchanged: list, counts: dict) -> Iterator[Tuple[str, dict, str]]:
+        # A key deleted outside this tool keeps its digest, so unchanged records are checked with one EXISTS
+        # round trip per batch and written again if they are gone.
+        if not unchanged:
+            return
+        with self.pipeline(transaction=False) as pipe:
+            for key_id, _, _ in unchanged:
+                pipe.exists(key_id)
+            exists = pipe.execute()
+        for (key_id, value_data, digest), present in zip(unchanged, exists):
+            if present:
+                counts["unchanged"] += 1
+            else:
+                counts["restored"] += 1
+                yield key_id, value_data, digest
+
+    @staticmethod
+    def record_digest(value_data: dict) -> str:
+        payload = json.dumps(dict(value_data), sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _execute_chunk(
+        self,
+        chunk,
+        removed_keys,
+        transaction: bool,
+        retries: int,
+        backoff: float,
+        key_prefix: str = "",
+        digest_index: str = None,
+        digests: Dict[str, str] = None,
+    ) -> None:
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer("redis.chunk", len(chunk) + len(removed_keys), self._payload_size(chunk)):
+                    with self.pipeline(transaction=transaction) as pipe:
+                        self._queue_chunk(pipe, chunk, removed_keys, key_prefix, digest_index, digests)
+                        pipe.execute()
+                return
+            except (ConnectionError, TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                delay = backoff * 2**attempt
+                attempt += 1
+                metrics.increment("redis.retries")
+                logger.warning(f"Chunk of {len(chunk)} records failed: {e}. Retry {attempt}/{retries} in {delay}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def _payload_size(chunk) -> int:
+        # Approximate bytes on the wire: keys, field names and values, without the protocol framing.
+        size = 0
+        for key_id, value_data in chunk:
+            size += len(key_id)
+            for field, value in value_data.items():
+                size += len(str(field)) + len(value if isinstance(value, (str, bytes)) else str(value))
+        return size
+
+    def _queue_chunk(
+        self, pipe, chunk, removed_keys, key_prefix: str, digest_index: str = None, digests: Dict[str, str] = None
+    ) -> None:
+        if removed_keys:
+            pipe.delete(*removed_keys)
+            if digest_index:
+                pipe.hdel(digest_index, *removed_keys)
+            if self.indexes:
+                for key_id in removed_keys:
+                    self._queue_unindex(pipe, key_id, key_prefix)
+            logger.info(f"Removing {len(removed_keys)} keys")
+        for key_id, value_data in chunk:
+            self._queue_record(pipe, key_id, value_data)
+            if self.indexes:
+                self._queue_index(pipe, key_id, value_data, key_prefix)
+        if digests:
+            pipe.hset(digest_index, mapping=digests)
+
+    @staticmethod
+    def _queue_record(pipe, key_id: str, value_data: dict) -> None:
+        # Records are rebuilt rather than merged so that fields and members which went away are dropped.
+        pipe.delete(key_id)
+        if isinstance(value_data, SortedSetRecord):
+            if value_data:
+                pipe.zadd(key_id, value_data)
+        elif value_data:
+            pipe.hset(key_id, mapping=value_data)
+
+    def _queue_index(self, pipe, key_id: str, value_data: dict, key_prefix: str) -> None:
+        media_type = self.media_type(value_data)
+        if media_type is None:
+            return
+        key = key_id[len(key_prefix) :]
+        title = value_data.get("title", value_data.get("artist", ""))
+        self._index_script(
+            keys=[
+                f"{key_prefix}{self.TITLE_INDEX_KEY}",
+                f"{key_prefix}{self.TITLE_MEMBERS_KEY}",
+                f"{key_prefix}{self.YEAR_INDEX_KEY}",
+                f"{key_prefix}{self.ADDED_INDEX_KEY}",
+                f"{key_prefix}{self.TYPE_INDEX_KEY.format(media_type)}",
+            ],
+            args=[
+                key,
+                f"{str(title).lower()}\x00{key}",
+                self._index_value(value_data.get("year")),
+                self._index_value(value_data.get("added_at")),
+            ],
+            client=pipe,
+        )
+
+    def _queue_unindex(self, pipe, key_id: str, key_prefix: str) -> None:
+        self._unindex_script(
+            keys=[
+                f"{key_prefix}{self.TITLE_INDEX_KEY}",
+                f"{key_prefix}{self.TITLE_MEMBERS_KEY}",
+                f"{key_prefix}{self.YEAR_INDEX_KEY}",
+                f"{key_prefix}{self.ADDED_INDEX_KEY}",
+            ]
+            + [f"{key_prefix}{self.TYPE_INDEX_KEY.format(media_type)}" for media_type in self.MEDIA_TYPES],
+            args=[key_id[len(key_prefix) :]],
+            client=pipe,
+        )
+
+    @staticmethod
+    def media_type(value_data: dict) -> Optional[str]:
+        # Top level records are told apart by their fields; shows still use "movie:" keys in the flat layout.
+        if isinstance(value_data, SortedSetRecord):
+            return None
+        if "file_path" in value_data:
+            return "movie"
+        if "show_location" in value_data:
+            return "show"
+        if "artist" in value_data:
+            return "artist"
+        return None
+
+    @staticmethod
+    def _index_value(value) -> str:
+        try:
+            return str(int(value))
+        except (TypeError, ValueError):
+            return ""
+
+    def search_titles(self, prefix: str, limit: int = 20, key_prefix: str = None) -> List[str]:
+        """Return up to ``limit`` record keys whose title starts with ``prefix``, in title order."""
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            prefix = prefix.lower().encode("utf-8")
+            members = self.zrangebylex(
+                f"{key_prefix}{self.TITLE_INDEX_KEY}", b"[" + prefix, b"[" + prefix + b"\xff", start=0, num=limit
+            )
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+        members = [member.decode("utf-8") if isinstance(member, bytes) else member for member in members]
+        return [member.split("\x00", 1)[1] for member in members]
+
+    def range_index(
+        self, index: str, minimum="-inf", maximum="+inf", limit: int = None, newest_first=False, key_prefix=None
+    ) -> List[str]:
+        """Return record keys from the year or added-date index (``"year"`` or ``"added"``) within a score range."""
+        index_keys = {"year": self.YEAR_INDEX_KEY, "added": self.ADDED_INDEX_KEY}
+        if index not in index_keys:
+            raise ValueError(f"index must be one of {', '.join(index_keys)}")
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            index_key = f"{key_prefix}{index_keys[index]}"
+            start, num = (0, limit) if limit is not None else (None, None)
+            if newest_first:
+                members = self.zrevrangebyscore(index_key, maximum, minimum, start=start, num=num)
+            else:
+                members = self.zrangebyscore(index_key, minimum, maximum, start=start, num=num)
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+        return [member.decode("utf-8") if isinstance(member, bytes) else member for member in members]
+
+    def keys_of_type(self, media_type: str, key_prefix: str = None) -> Iterator[str]:
+        if media_type not in self.MEDIA_TYPES:
+            raise ValueError(f"media_type must be one of {', '.join(self.MEDIA_TYPES)}")
+        if key_prefix is None:
+            key_prefix = self.current_prefix()
+        type_key = f"{key_prefix}{self.TYPE_INDEX_KEY.format(media_type)}"
+        for member in self.sscan_iter(type_key, count=self.SCAN_COUNT):
+            yield member.decode("utf-8") if isinstance(member, bytes) else member
+
+    def iter_records(
+        self,
+        media_type: str = None,
+        count: int = SCAN_COUNT,
+        batch_size: int = DEFAULT_CHUNK_SIZE,
+        key_prefix: str = None,
+    ) -> Iterator[Tuple[str, dict]]:
+        """Lazily yield ``(key, record)`` for every record hash, or only those of ``media_type``.
+
+        Keys are enumerated with SCAN, so the server is never blocked the way KEYS blocks it, and the hashes
+        are fetched with one pipelined HGETALL round trip per ``batch_size`` keys.  Keys are yielded without
+        the version prefix and records are decoded as by ``get_record``, with the path root table read once.
+        Like SCAN itself, this may yield a key more than once while the server is rehashing, so consumers
+        should be idempotent; duplicates are only dropped within a batch, which keeps memory bounded.
+        """
+        if media_type is not None and media_type not in self.MEDIA_TYPES:
+            raise ValueError(f"media_type must be one of {', '.join(self.MEDIA_TYPES)}")
+        patterns = self.MEDIA_TYPE_PATTERNS[media_type] if media_type else ("*",)
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            path_roots = PathRoots.from_record(self.hgetall(f"{key_prefix}{PATH_ROOTS_KEY}"))
+            for pattern in patterns:
+                batch = {}
+                for key in self._scan_record_keys(pattern, key_prefix, count):
+                    batch[key] = None
+                    if len(batch) >= batch_size:
+                        yield from self._fetch_batch(list(batch), key_prefix, media_type, path_roots)
+                        batch = {}
+                if batch:
+                    yield from self._fetch_batch(list(batch), key_prefix, media_type, path_roots)
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+
+    def _scan_record_keys(self, pattern: str, key_prefix: str, count: int) -> Iterator[str]:
+        for key_id in self.scan_iter(match=f"{key_prefix}{pattern}", count=count, _type="hash"):
+            if isinstance(key_id, bytes):
+                key_id = key_id.decode("utf-8")
+            key = key_id[len(key_prefix) :]
+            if key.startswith(self.INTERNAL_PREFIXES):
+                continue
+            if not key_prefix and self.VERSIONED_KEY.match(key):
+                continue
+            yield key
+
+    def _fetch_batch(
+        self, keys: List[str], key_prefix: str, media_type: str = None, path_roots: PathRoots = None
+    ) -> Iterator[Tuple[str, dict]]:
+        with self.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(f"{key_prefix}{key}")
+            raw_records = self._execute_reads(pipe)
+        for key, raw in zip(keys, raw_records):
+            if not raw:
+                continue
+            record = self.decode_record(raw, path_roots)
+            if media_type is None or self.media_type(record) == media_type:
+                yield key, record
+
+    def _execute_reads(self, pipe) -> list:
+        try:
+            return pipe.execute()
+        except UnicodeDecodeError as e:
+            logger.error("Found binary codec values while reading through a decoding client")
+            raise ValueError(self.BINARY_VALUES_ERROR) from e
+
+    def get_children(self, index_key: str, key_prefix: str = None) -> List[str]:
+        """Return the member keys of a normalized index such as ``show:<id>:seasons`` in score order."""
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            members = self.zrange(f"{key_prefix}{index_key}", 0, -1)
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+        return [member.decode("utf-8") if isinstance(member, bytes) else member for member in members]
+
+    def get_record(self, key: str, key_prefix: str = None) -> Optional[dict]:
+        """Return the record stored at ``key`` with its episodes or tracks decoded and its paths expanded."""
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            with self.pipeline(transaction=False) as pipe:
+                pipe.hgetall(f"{key_prefix}{key}")
+                pipe.hgetall(f"{key_prefix}{PATH_ROOTS_KEY}")
+                raw, path_roots = self._execute_reads(pipe)
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+        return self.decode_record(raw, PathRoots.from_record(path_roots)) if raw else None
+
+    def path_roots(self, key_prefix: str = None) -> Optional[PathRoots]:
+        """Return the path root table of an upload made with ``compress_paths``, or None if paths are stored whole."""
+        try:
+            if key_prefix is None:
+                key_prefix = self.current_prefix()
+            return PathRoots.from_record(self.hgetall(f"{key_prefix}{PATH_ROOTS_KEY}"))
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+
+    def decode_record(self, raw: dict, path_roots: PathRoots = None) -> dict:
+        record = {}
+        for field, value in raw.items():
+            if isinstance(field, bytes):
+                field = field.decode("utf-8")
+            if field in self.PAYLOAD_FIELDS or field.startswith(self.PAYLOAD_FIELD_PREFIXES):
+                record[field] = decode_value(value)
+            else:
+                record[field] = value.decode("utf-8") if isinstance(value, bytes) else value
+        if path_roots is not None:
+            path_roots.expand_record(record)
+        return record
+
+    def current_version(self) -> Optional[int]:
+        version = self.get(self.CURRENT_VERSION_KEY)
+        return int(version) if version is not None else None
+
+    def current_prefix(self) -> str:
+        version = self.current_version()
+        return self.version_prefix(version) if version is not None else ""
+
+    @staticmethod
+    def version_prefix(version: int) -> str:
+        return f"v{version}:"
+
+    def publish_version(
+        self,
+        records: Iterable[Tuple[str, dict]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        checkpoint: UploadCheckpoint = None,
+        background: bool = True,
+        pipelines: int = 1,
+    ) -> int:
+        """Upload ``records`` into a new versioned keyspace and make it live once complete.
+
+        Readers keep seeing the previous version until the pointer in ``CURRENT_VERSION_KEY`` is flipped.
+        The previous version is then reclaimed with SCAN and UNLINK, in ``reclaim_thread`` when
+        ``background`` is set.  An interrupted upload leaves its version pending for the next call to resume.
+        With a ``checkpoint`` the records are written by ``write_records`` and resume from its offset.
+        Without one they go through ``diff_db``, which resumes by digest and leaves the version with a
+        complete digest index.
+        """
+        try:
+            version = self.get(self.PENDING_VERSION_KEY)
+            if version is None:
+                version = self.incr(self.VERSION_COUNTER_KEY)
+                self.set(self.PENDING_VERSION_KEY, version)
+                logger.info(f"Uploading new version {version}")
+            else:
+                version = int(version)
+                logger.info(f"Resuming pending version {version}")
+
+            if checkpoint is not None:
+                self.write_records(
+                    records,
+                    chunk_size=chunk_size,
+                    transaction=False,
+                    checkpoint=checkpoint,
+                    key_prefix=self.version_prefix(version),
+                    pipelines=pipelines,
+                )
+            else:
+                self.diff_db(
+                    records,
+                    chunk_size=chunk_size,
+                    transaction=False,
+                    key_prefix=self.version_prefix(version),
+                    pipelines=pipelines,
+                )
+
+            with self.pipeline(transaction=True) as pipe:
+                # SET with GET replaces GETSET, which is deprecated as of Redis 6.2.
+                pipe.set(self.CURRENT_VERSION_KEY, version, get=True)
+                pipe.delete(self.PENDING_VERSION_KEY)
+                previous_version, _ = pipe.execute()
+            logger.info(f"Version {version} is now live")
+        except ConnectionError:
+            logger.error("Could not connect to Redis server")
+            raise
+        except TimeoutError:
+            logger.error("Redis command timed out")
+            raise
+        except RedisError as e:
+            logger.error("An unexpected Redis error occurred: %s", e)
+            raise
+
+        if previous_version is None:
+            patterns = self.LEGACY_PATTERNS
+        else:
+            patterns = (f"{self.version_prefix(int(previous_version))}*",)
+        if background:
+            self.reclaim_thread = threading.Thread(target=self.reclaim_keys, args=(patterns,), name="redis-reclaim")
+            self.reclaim_thread.start()
+        else:
+            self.reclaim_keys(patterns)
+        return version
 
-    def make_db(self) -> None:
+    def reclaim_keys(self, patterns: Iterable[str]) -> int:
+        reclaimed = 0
         try:
-            with self.pipeline() as pipe:
-                for key_id, value_data in self.plex_db.items():
-                    pipe.hset(key_id, mapping=value_data)
-                pipe.execute()
-            logger.info("Database created successfully")
+            for pattern in patterns:
+                batch = []
+                for key in self.scan_iter(match=pattern, count=self.SCAN_COUNT):
+                    batch.append(key)
+                    if len(batch) >= self.SCAN_COUNT:
+                        reclaimed += self.unlink(*batch)
+                        batch = []
+                if batch:
+                    reclaimed += self.unlink(*batch)
+            logger.info(f"Reclaimed {reclaimed} keys matching {', '.join(patterns)}")
+            return reclaimed
         except ConnectionError:
             logger.error("Could not connect to Redis server")
             raise
@@ -45,7 +828,8 @@ class RedisPlexDB(StrictRedis):
 
     def delete_db(self) -> None:
         try:
-            self.flushdb()
+            # ASYNC frees the keyspace in a background thread on the server instead of blocking it.
+            self.flushdb(asynchronous=True)
             logger.info("Database deleted successfully")
         except ConnectionError:
             logger.error("Could not connect to Redis server")
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Tuple
+
+from .logging import setup_logger
+from .metrics import metrics
+from .value_codecs import ValueCodec
+
+logger = setup_logger()
+
+# Episode rows are (season_number, [(episode_number, episode_name, episode_filename), ...]) per season, and
+# track rows are (album_key, track_number, track_name, track_location) per track.  Plain tuples are far
+# cheaper to pickle into a worker process than the nested dicts they are expanded into.
+EpisodeRows = List[Tuple[int, List[tuple]]]
+TrackRows = List[Tuple[str, object, str, object]]
+
+
+def episodes_payload(rows: EpisodeRows) -> dict:
+    episode_dict = {}
+    for season_number, episodes in rows:
+        season_dict = episode_dict[f"season:{season_number}"] = {}
+        for episode_number, episode_name, episode_filename in episodes:
+            season_dict[f"episode:{episode_number}"] = {
+                "episode_name": episode_name,
+                "episode_filename": episode_filename,
+            }
+    return episode_dict
+
+
+def tracks_payload(rows: TrackRows) -> dict:
+    track_db = {}
+    for album_key, track_number, track_name, track_location in rows:
+        track_db[album_key] = {
+            "track_number": track_number,
+            "track_name": track_name,
+            "track_location": track_location,
+        }
+    return track_db
+
+
+def encode_rows(codec: ValueCodec, build: Callable, rows: list):
+    return codec.encode(build(rows))
+
+
+# Set once in each worker process by the pool initializer, so a call only ships the build function and rows.
+_worker_codec: ValueCodec = None
+
+
+def _init_worker(codec: ValueCodec) -> None:
+    global _worker_codec
+    _worker_codec = codec
+
+
+def _encode_in_worker(build: Callable, rows: list):
+    return encode_rows(_worker_codec, build, rows)
+
+
+class SerializationPool:
+    """Builds and encodes episode and track payloads in worker processes.
+
+    Encoding is pure CPU work, so on the harvest threads it competes with network I/O for the GIL.  The
+    calling thread still waits for its payload, but it releases the GIL while it does, so the other harvest
+    threads keep fetching as the payload is encoded on another core.  Rows are pickled on every call and the
+    result pickled back, so the pool only pays off when building and encoding a payload costs more than that
+    round trip, as it does for shows with thousands of episodes; ``benchserialize`` measures where that is.
+    Workers are spawned rather than forked, as the harvest already runs threads and open sockets.
+    """
+
+    def __init__(self, codec: ValueCodec, workers: int) -> None:
+        if not isinstance(workers, int) or workers <= 0:
+            raise ValueError("workers must be a positive integer")
+        self.codec = codec
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Several harvest threads encode at once, so the pool is started under the lock to start it only once.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.codec,),
+                    )
+                    logger.info(f"Started {self.workers} serialization processes")
+        return self._executor
+
+    def encode(self, build: Callable, rows: list):
+        executor = self._get_executor()
+        # Measured from the caller's side, so the stage shows how long harvest threads wait on the pool.
+        with metrics.timer("serialize") as counts:
+            encoded = executor.submit(_encode_in_worker, build, rows).result()
+            counts["bytes"] = len(encoded)
+        return encoded
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
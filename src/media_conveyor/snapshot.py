@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import base64
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .configurations import Configuration
+from .logging import setup_logger
+from .paths import PATH_ROOTS_KEY
+from .records import SortedSetRecord
+
+logger = setup_logger()
+
+
+class SnapshotCache:
+    DEFAULT_TTL = 24 * 60 * 60
+    # Records of a section being stored are written under this prefix and renamed once the section is complete.
+    STAGING_PREFIX = "staging:"
+    STAGING_BATCH_SIZE = 500
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sections (
+            section_id TEXT PRIMARY KEY,
+            captured_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            section_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (section_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS section_roots (
+            section_id TEXT PRIMARY KEY,
+            roots TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, snapshot_path: Path = None, ttl: Optional[float] = DEFAULT_TTL) -> None:
+        if snapshot_path is None:
+            snapshot_path = Configuration().state_path / "plex_snapshot.sqlite3"
+        self.snapshot_path = Path(snapshot_path)
+        self.ttl = ttl
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        # A section may be stored from a generator that is consumed on another thread, so the connection is not
+        # tied to the thread that opened it.  Writes are serialized by the lock and kept to short transactions.
+        self.connection = sqlite3.connect(self.snapshot_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.executescript(self.SCHEMA)
+        logger.info(f"Snapshot cache opened at {self.snapshot_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def is_fresh(self, section_id: str, updated_at: datetime = None) -> bool:
+        """A section is fresh if it was captured within the TTL and after Plex last updated it."""
+        row = self.connection.execute("SELECT captured_at FROM sections WHERE section_id = ?", (section_id,)).fetchone()
+        if row is None:
+            return False
+        captured_at = row[0]
+        if self.ttl is not None and time.time() - captured_at > self.ttl:
+            logger.info(f"Snapshot of section {section_id} is older than {self.ttl}s")
+            return False
+        if updated_at is not None and updated_at.timestamp() > captured_at:
+            logger.info(f"Section {section_id} was updated in Plex after its snapshot was taken")
+            return False
+        return True
+
+    def store(
+        self, section_id: str, records: Iterable[Tuple[str, dict]], path_roots: Dict[str, str] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        """Pass ``records`` through while writing them to the snapshot.
+
+        Records are staged in short transactions as they stream past, and the section is swapped in only once
+        ``records`` is exhausted, so an interrupted harvest never leaves a partial section behind.  No
+        transaction stays open while the caller handles a record.  The generator may be consumed on any
+        thread, but only by one consumer at a time.  ``path_roots`` is the table the records' paths were
+        compressed with, which ``iter_records`` replays along with them.
+        """
+        staging_id = f"{self.STAGING_PREFIX}{section_id}"
+        captured_at = time.time()
+        count = 0
+        try:
+            with self._lock, self.connection:
+                self.connection.execute("DELETE FROM records WHERE section_id = ?", (staging_id,))
+            rows = []
+            for position, (key, value_data) in enumerate(records):
+                kind = "zset" if isinstance(value_data, SortedSetRecord) else "hash"
+                rows.append((staging_id, position, key, kind, json.dumps(dict(value_data), default=self._encode_bytes)))
+                if len(rows) >= self.STAGING_BATCH_SIZE:
+                    self._insert_records(rows)
+                    rows = []
+                count += 1
+                yield key, value_data
+            self._insert_records(rows)
+            with self._lock, self.connection:
+                self.connection.execute("DELETE FROM sections WHERE section_id = ?", (section_id,))
+                self.connection.execute("DELETE FROM records WHERE section_id = ?", (section_id,))
+                self.connection.execute("DELETE FROM section_roots WHERE section_id = ?", (section_id,))
+                self.connection.execute(
+                    "UPDATE records SET section_id = ? WHERE section_id = ?", (section_id, staging_id)
+                )
+                if path_roots:
+                    self.connection.execute(
+                        "INSERT INTO section_roots (section_id, roots) VALUES (?, ?)",
+                        (section_id, json.dumps(path_roots)),
+                    )
+                self.connection.execute(
+                    "INSERT INTO sections (section_id, captured_at) VALUES (?, ?)", (section_id, captured_at)
+                )
+            logger.info(f"Stored {count} records for section {section_id} in the snapshot")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store section {section_id} in the snapshot: {e}")
+            raise
+
+    def _insert_records(self, rows: list) -> None:
+        if not rows:
+            return
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO records (section_id, position, key, kind, value) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def load(self, section_id: str) -> Iterator[Tuple[str, dict]]:
+        cursor = self.connection.execute(
+            "SELECT key, kind, value FROM records WHERE section_id = ? ORDER BY position", (section_id,)
+        )
+        for key, kind, value in cursor:
+            value_data = json.loads(value, object_hook=self._decode_bytes)
+            yield key, SortedSetRecord(value_data) if kind == "zset" else value_data
+
+    def iter_records(self) -> Iterator[Tuple[str, dict]]:
+        """Yield every cached record, section by section, without touching Plex.
+
+        Section ids take the form ``<uuid>:<variant>``, the variant naming the layout, codec and path roots
+        the records were built with.  Only the newest snapshot of each uuid is replayed, so a section cached
+        in several variants is not written twice in mixed shapes.  Sections stored with compressed paths are
+        preceded by the path roots table under ``PATH_ROOTS_KEY``, so the records stay readable once they are
+        written to Redis.
+        """
+        newest = {}
+        cursor = self.connection.execute("SELECT section_id FROM sections ORDER BY captured_at, section_id")
+        for (section_id,) in cursor:
+            newest[section_id.partition(":")[0]] = section_id
+        section_ids = sorted(newest.values())
+        stale = self.connection.execute("SELECT COUNT(*) FROM sections").fetchone()[0] - len(section_ids)
+        if stale:
+            logger.info(f"Skipping {stale} older snapshots of sections cached in another variant")
+        path_roots = self._path_roots(section_ids)
+        if path_roots:
+            yield PATH_ROOTS_KEY, path_roots
+        for section_id in section_ids:
+            yield from self.load(section_id)
+
+    def _path_roots(self, section_ids: List[str]) -> Dict[str, str]:
+        # Root ids are derived from the roots themselves, so the tables of several sections merge without clashes.
+        path_roots = {}
+        for section_id in section_ids:
+            row = self.connection.execute(
+                "SELECT roots FROM section_roots WHERE section_id = ?", (section_id,)
+            ).fetchone()
+            if row is not None:
+                path_roots.update(json.loads(row[0]))
+        return path_roots
+
+    def invalidate(self, section_id: str = None) -> None:
+        with self._lock, self.connection:
+            if section_id is None:
+                self.connection.execute("DELETE FROM sections")
+                self.connection.execute("DELETE FROM records")
+                self.connection.execute("DELETE FROM section_roots")
+                logger.info("Invalidated the whole snapshot cache")
+            else:
+                self.connection.execute("DELETE FROM sections WHERE section_id = ?", (section_id,))
+                self.connection.execute("DELETE FROM records WHERE section_id = ?", (section_id,))
+                self.connection.execute("DELETE FROM section_roots WHERE section_id = ?", (section_id,))
+                logger.info(f"Invalidated section {section_id} in the snapshot cache")
+
+    @staticmethod
+    def _encode_bytes(value):
+        # Binary codecs produce bytes payloads, which JSON cannot hold directly.
+        if isinstance(value, bytes):
+            return {"__bytes__": base64.b64encode(value).decode("ascii")}
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    @staticmethod
+    def _decode_bytes(value: dict):
+        if len(value) == 1 and "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return value
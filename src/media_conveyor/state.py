@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from .configurations import Configuration
+from .logging import setup_logger
+from .utils import write_json_atomic
+
+logger = setup_logger()
+
+
+class SyncState:
+    # The path roots table the synced records were compressed with, kept next to the sections in the state file.
+    PATH_ROOTS_ENTRY = "meta:path_roots"
+
+    def __init__(self, state_path: Path = None) -> None:
+        if state_path is None:
+            state_path = Configuration().state_path
+        self.state_path = Path(state_path)
+        self.state_file = self.state_path / "plex_sync.json"
+        self._path_roots: Dict[str, str] = {}
+        self._sections = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_file, "r") as file:
+                sections = json.load(file)
+                self._path_roots = sections.pop(self.PATH_ROOTS_ENTRY, {})
+                logger.info(f"Loaded sync state for {len(sections)} sections from {self.state_file}")
+                return sections
+        except FileNotFoundError:
+            logger.info(f"No sync state found at {self.state_file}. A full sync will be performed.")
+            return {}
+        except json.JSONDecodeError:
+            logger.error(f"Error decoding JSON from {self.state_file}. A full sync will be performed.")
+            return {}
+
+    def watermark(self, section_id: str) -> Optional[int]:
+        return self._sections.get(section_id, {}).get("watermark")
+
+    def keys(self, section_id: str) -> Dict[str, str]:
+        return dict(self._sections.get(section_id, {}).get("keys", {}))
+
+    def leaf_counts(self, section_id: str) -> Dict[str, int]:
+        return dict(self._sections.get(section_id, {}).get("leaf_counts", {}))
+
+    def watermark_keys(self, section_id: str) -> Set[str]:
+        # Rating keys of the items already synced whose last change falls in the watermark's own second.
+        return set(self._sections.get(section_id, {}).get("watermark_keys", []))
+
+    def path_roots(self) -> Dict[str, str]:
+        return dict(self._path_roots)
+
+    def update_path_roots(self, path_roots: Dict[str, str]) -> None:
+        self._path_roots = dict(path_roots)
+
+    def update(
+        self,
+        section_id: str,
+        watermark: int,
+        keys: Dict[str, str],
+        leaf_counts: Dict[str, int] = None,
+        watermark_keys: Set[str] = None,
+    ) -> None:
+        self._sections[section_id] = {
+            "watermark": watermark,
+            "keys": keys,
+            "leaf_counts": leaf_counts or {},
+            "watermark_keys": sorted(watermark_keys or []),
+        }
+
+    def reset(self) -> None:
+        logger.info("Resetting sync state")
+        self._sections = {}
+        self._path_roots = {}
+
+    def save(self) -> None:
+        logger.info(f"Saving sync state to {self.state_file}")
+        try:
+            self.state_path.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.state_file, {**self._sections, self.PATH_ROOTS_ENTRY: self._path_roots})
+        except IOError:
+            logger.error("Failed to write to the sync state file. Check your file permissions.")
+            raise
+
+
+class UploadCheckpoint:
+    def __init__(self, name: str = "upload", state_path: Path = None) -> None:
+        if state_path is None:
+            state_path = Configuration().state_path
+        self.state_path = Path(state_path)
+        self.checkpoint_file = self.state_path / f"{name}_checkpoint.json"
+        self.offset, self.last_key = self._load()
+
+    def _load(self) -> Tuple[int, Optional[str]]:
+        try:
+            with open(self.checkpoint_file, "r") as file:
+                checkpoint = json.load(file)
+                logger.info(f"Resuming upload after {checkpoint['offset']} records (last key {checkpoint['last_key']})")
+                return checkpoint["offset"], checkpoint["last_key"]
+        except FileNotFoundError:
+            return 0, None
+        except (json.JSONDecodeError, KeyError):
+            logger.error(f"Error decoding checkpoint from {self.checkpoint_file}. Starting from the beginning.")
+            return 0, None
+
+    def commit(self, offset: int, last_key: str) -> None:
+        self.offset, self.last_key = offset, last_key
+        try:
+            self.state_path.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.checkpoint_file, {"offset": offset, "last_key": last_key})
+        except IOError:
+            logger.error("Failed to write to the upload checkpoint file. Check your file permissions.")
+            raise
+
+    def clear(self) -> None:
+        self.offset, self.last_key = 0, None
+        if self.checkpoint_file.exists():
+            self.checkpoint_file.unlink()
+            logger.info(f"Removed upload checkpoint {self.checkpoint_file}")
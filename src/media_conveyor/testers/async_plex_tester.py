@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from ..authentication import PlexAuthentication
+from ..logging import setup_logger
+from ..plex_async import AsyncPlexData
+from ..plex_data import PlexData
+from .fake_plex_server import FakePlexServer, synthetic_library
+
+logger = setup_logger()
+
+
+async def harvest(baseurl, token, max_connections=8):
+    async with AsyncPlexData(baseurl, token, max_connections=max_connections) as plex_data:
+        return await plex_data.compile_libraries(movies=True, shows=True, music=True)
+
+
+def main():
+    plex_auth = PlexAuthentication()
+    start = time.perf_counter()
+    db = asyncio.run(harvest(plex_auth.baseurl, plex_auth.token))
+    print(f"Harvested {len(db)} records in {time.perf_counter() - start:.2f}s")
+
+
+def compare():
+    # Harvest a synthetic library with both harvesters and check the records match key for key.
+    library = synthetic_library(movies=200, shows=20, seasons=3, episodes=8, artists=20, albums=3, tracks=10)
+    with FakePlexServer(library, latency=0.005) as server:
+        start = time.perf_counter()
+        plex_data = PlexData(server.baseurl, "fake-token")
+        expected = plex_data.compile_libraries(movies=True, shows=True, music=True)
+        sync_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = asyncio.run(harvest(server.baseurl, "fake-token"))
+        async_time = time.perf_counter() - start
+
+    if list(actual.items()) != list(expected.items()):
+        mismatched = [key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key)]
+        logger.error(f"{len(mismatched)} records differ, e.g. {sorted(mismatched)[:5]}")
+        raise SystemExit(1)
+    print(f"{len(actual)} records match.  PlexData: {sync_time:.2f}s, AsyncPlexData: {async_time:.2f}s")
@@ -0,0 +1,306 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+from redis import ConnectionError
+
+from ..logging import setup_logger
+from ..metrics import metrics
+from ..plex_data import PlexData
+from ..records import MovieRecord, shared
+from ..redis_db import RedisPlexDB
+from ..serialization import SerializationPool, encode_rows, episodes_payload
+from ..value_codecs import JSONCodec
+from .fake_plex_server import fake_plex_process
+
+logger = setup_logger()
+
+# Library shapes for synthetic_library.  Shows get deep season trees and artists many albums, since those
+# are the parts of a harvest that cost one request per season or album.
+PROFILES = {
+    "small": {"movies": 1000, "shows": 50, "seasons": 5, "episodes": 10, "artists": 50, "albums": 5, "tracks": 10},
+    "medium": {"movies": 10000, "shows": 200, "seasons": 10, "episodes": 20, "artists": 200, "albums": 8, "tracks": 12},
+    "large": {
+        "movies": 100000,
+        "shows": 1000,
+        "seasons": 10,
+        "episodes": 20,
+        "artists": 1000,
+        "albums": 10,
+        "tracks": 12,
+    },
+}
+# Compared by --compare, with whether a higher value is the better one.
+COMPARED_METRICS = {
+    ("harvest", "seconds"): False,
+    ("harvest", "records_per_second"): True,
+    ("harvest", "cpu_seconds"): False,
+    ("harvest", "http_requests"): False,
+    ("harvest", "http_bytes"): False,
+    ("serialize", "seconds"): False,
+    ("memory", "peak_bytes"): False,
+    ("upload", "seconds"): False,
+    ("upload", "records_per_second"): True,
+    ("upload", "bytes_per_second"): True,
+}
+
+
+def harvest(baseurl: str, max_workers: int, bulk: bool, lean: bool = False, serialize_workers: int = 0) -> dict:
+    plex_data = PlexData(
+        baseurl, "benchmark-token", max_workers=max_workers, bulk=bulk, lean=lean, serialize_workers=serialize_workers
+    )
+    try:
+        return plex_data.compile_libraries(movies=True, shows=True, music=True)
+    finally:
+        plex_data.close()
+
+
+def measure_harvest(
+    baseurl: str, max_workers: int, bulk: bool, lean: bool = False, serialize_workers: int = 0
+) -> tuple:
+    metrics.reset()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    plex_db = harvest(baseurl, max_workers, bulk, lean, serialize_workers)
+    cpu_seconds = time.process_time() - cpu_start
+    seconds = time.perf_counter() - start
+    stages = metrics.report()["stages"]
+    http = stages.get("plex.http", {})
+    serialize = stages.get("serialize", {})
+    results = {
+        "harvest": {
+            "seconds": round(seconds, 4),
+            "records": len(plex_db),
+            "records_per_second": round(len(plex_db) / seconds, 2),
+            # CPU time of this process only, so parsing and record building without the fake server's share.
+            "cpu_seconds": round(cpu_seconds, 4),
+            "http_requests": http.get("calls", 0),
+            "http_bytes": http.get("bytes", 0),
+            "http_p50_seconds": http.get("p50_seconds", 0.0),
+            "http_p95_seconds": http.get("p95_seconds", 0.0),
+        },
+        "serialize": {
+            "seconds": serialize.get("total_seconds", 0.0),
+            "payloads": serialize.get("calls", 0),
+            "bytes": serialize.get("bytes", 0),
+        },
+    }
+    return plex_db, results
+
+
+def measure_memory(baseurl: str, max_workers: int, bulk: bool, lean: bool = False) -> dict:
+    # A separate pass, because tracing every allocation would distort the harvest timings.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        plex_db = harvest(baseurl, max_workers, bulk, lean)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak, "retained_bytes": retained, "bytes_per_record": round(retained / len(plex_db), 1)}
+
+
+def measure_upload(plex_db: dict, host: str, port: int, chunk_size: int, pipelines: int) -> dict:
+    redis_client = RedisPlexDB(host=host, port=port, max_connections=pipelines + 1)
+    try:
+        redis_client.ping()
+    except ConnectionError:
+        logger.warning(f"No Redis server at {host}:{port}; skipping the upload benchmark")
+        return {"skipped": f"no Redis server at {host}:{port}"}
+    # Records go under their own prefix so that a benchmark never touches real data on the same server.
+    key_prefix = f"bench:{int(time.time())}:"
+    metrics.reset()
+    start = time.perf_counter()
+    try:
+        written = redis_client.write_records(
+            plex_db.items(), chunk_size=chunk_size, transaction=False, key_prefix=key_prefix, pipelines=pipelines
+        )
+        seconds = time.perf_counter() - start
+    finally:
+        redis_client.reclaim_keys([f"{key_prefix}*"])
+    chunks = metrics.report()["stages"].get("redis.chunk", {})
+    return {
+        "seconds": round(seconds, 4),
+        "records": written,
+        "records_per_second": round(written / seconds, 2),
+        "bytes": chunks.get("bytes", 0),
+        "bytes_per_second": round(chunks.get("bytes", 0) / seconds, 2),
+        "chunk_p50_seconds": chunks.get("p50_seconds", 0.0),
+        "chunk_p95_seconds": chunks.get("p95_seconds", 0.0),
+        "chunk_size": chunk_size,
+        "pipelines": pipelines,
+    }
+
+
+def run(args) -> dict:
+    shape = dict(PROFILES[args.profile])
+    for name in shape:
+        if getattr(args, name) is not None:
+            shape[name] = getattr(args, name)
+    logger.info(f"Generating {args.profile} library: {shape}")
+
+    results = {
+        "profile": args.profile,
+        "library": shape,
+        "settings": {
+            "max_workers": args.max_workers,
+            "bulk": args.bulk,
+            "lean": args.lean,
+            "serialize_workers": args.serialize_workers,
+            "latency": args.latency,
+        },
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "version": package_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    with fake_plex_process(latency=args.latency, seed=args.seed, **shape) as baseurl:
+        plex_db, harvest_results = measure_harvest(
+            baseurl, args.max_workers, args.bulk, args.lean, args.serialize_workers
+        )
+        results.update(harvest_results)
+        if not args.skip_memory:
+            results["memory"] = measure_memory(baseurl, args.max_workers, args.bulk, args.lean)
+    if not args.skip_upload:
+        results["upload"] = measure_upload(plex_db, args.redis_host, args.redis_port, args.chunk_size, args.pipelines)
+    return results
+
+
+def package_version() -> str:
+    try:
+        from ..version import version
+    except ImportError:
+        return "unknown"
+    return version
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\n{'metric':<34}{'baseline':>14}{'current':>14}{'change':>10}")
+    for (group, name), higher_is_better in COMPARED_METRICS.items():
+        old = baseline.get(group, {}).get(name)
+        new = results.get(group, {}).get(name)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        regressed = change < 0 if higher_is_better else change > 0
+        flag = "  worse" if regressed and abs(change) >= 5 else ""
+        print(f"{group + '.' + name:<34}{old:>14.4f}{new:>14.4f}{change:>+9.1f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark harvesting and uploading a synthetic Plex library.")
+    parser.add_argument("--profile", choices=PROFILES, default="small")
+    for name in PROFILES["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the number of {name} in the profile")
+    parser.add_argument("--seed", type=int, default=444)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake Plex response")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--lean", action="store_true", help="request only the stored fields and skip plexapi objects")
+    parser.add_argument("--serialize-workers", type=int, default=0, help="processes that encode episodes and tracks")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--chunk-size", type=int, default=RedisPlexDB.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--pipelines", type=int, default=1)
+    parser.add_argument("--skip-memory", action="store_true")
+    parser.add_argument("--skip-upload", action="store_true")
+    parser.add_argument("--output", type=Path, help="results file, by default under benchmark_results/")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or Path("benchmark_results") / f"{args.profile}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=4)
+    print(json.dumps({key: value for key, value in results.items() if isinstance(value, dict)}, indent=4))
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(results, json.load(file))
+
+
+def record_memory(count: int = 100000):
+    # Compares the footprint of slotted records with the plain dicts they replaced, for the same values.
+    def build(make_record):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            records = {
+                f"movie:Movie{number}:{1950 + number % 75}": make_record(
+                    f"Movie {number}",
+                    1950 + number % 75,
+                    f"/media/movies/Movie {number} ({1950 + number % 75})/Movie {number}.mkv",
+                    f"/library/metadata/{number}/thumb/1700000000",
+                    1600000000 + number,
+                )
+                for number in range(count)
+            }
+            return tracemalloc.get_traced_memory()[0], len(records)
+        finally:
+            tracemalloc.stop()
+
+    def as_dict(*values):
+        return dict(zip(MovieRecord.FIELDS, values))
+
+    def as_record(title, year, *values):
+        return MovieRecord(title, shared(year), *values)
+
+    dict_bytes, _ = build(as_dict)
+    record_bytes, _ = build(as_record)
+    print(f"{'records':<14}{'bytes':>14}{'per record':>12}")
+    print(f"{'dict':<14}{dict_bytes:>14}{dict_bytes / count:>12.1f}")
+    print(f"{'MovieRecord':<14}{record_bytes:>14}{record_bytes / count:>12.1f}")
+    print(f"Saved {1 - record_bytes / dict_bytes:.1%}")
+
+
+def serialize_scaling(shows: int = 200, episodes: int = 5000, max_processes: int = None):
+    # Daily and talk shows run to thousands of episodes, which is where encoding starts to cost.  Each
+    # process count encodes the same payloads from a thread pool, as the harvest threads would.
+    seasons = max(1, episodes // 200)
+    payloads = [
+        [
+            (
+                season,
+                [
+                    (episode, f"Episode {episode}", f"Show {number} - s{season:02d}e{episode:03d}")
+                    for episode in range(1, episodes // seasons + 1)
+                ],
+            )
+            for season in range(1, seasons + 1)
+        ]
+        for number in range(shows)
+    ]
+    codec = JSONCodec()
+    counts = [0] + [2**power for power in range(0, 8) if 2**power <= (max_processes or os.cpu_count() or 1)]
+    print(f"{shows} shows of {episodes} episodes on {os.cpu_count()} cores")
+    print(f"{'processes':<12}{'seconds':>10}{'shows/s':>12}{'speedup':>10}")
+    baseline = None
+    for processes in counts:
+        pool = SerializationPool(codec, processes) if processes else None
+        try:
+            if pool is not None:
+                # Start the workers before the clock, as a harvest pays that once and not per payload.
+                pool.encode(episodes_payload, [])
+            start = time.perf_counter()
+            if pool is None:
+                encode = partial(encode_rows, codec, episodes_payload)
+            else:
+                encode = partial(pool.encode, episodes_payload)
+            with ThreadPoolExecutor(max_workers=max(processes, 1) * 2) as executor:
+                list(executor.map(encode, payloads))
+            seconds = time.perf_counter() - start
+        finally:
+            if pool is not None:
+                pool.close()
+        baseline = baseline or seconds
+        label = processes or "in-thread"
+        print(f"{label:<12}{seconds:>10.3f}{shows / seconds:>12.1f}{baseline / seconds:>9.2f}x")
@@ -0,0 +1,64 @@
+import random
+import timeit
+
+from ..connections import SSHTunnel, TunnelConfig
+from ..infrastructure import AWSStateData
+from ..logging import setup_logger
+from ..redis_db import RedisPlexDB
+from ..value_codecs import JSONCodec, MsgpackCodec, decode_value
+
+logger = setup_logger()
+setup_logger(level="INFO")
+
+random.seed(444)
+CODECS = {
+    "json": JSONCodec(),
+    "json+zlib": JSONCodec(compress_threshold=0),
+    "msgpack": MsgpackCodec(),
+    "msgpack+zlib": MsgpackCodec(compress_threshold=0),
+}
+
+
+def synthetic_episodes(seasons: int, episodes: int) -> dict:
+    return {
+        f"season:{season}": {
+            f"episode:{episode}": {
+                "episode_name": f"Episode {random.getrandbits(24):x}",
+                "episode_filename": f"Some Long Show Name - S{season:02d}E{episode:02d} - {random.getrandbits(32):x}",
+            }
+            for episode in range(1, episodes + 1)
+        }
+        for season in range(1, seasons + 1)
+    }
+
+
+def main():
+    number = 200
+    for seasons, episodes in ((1, 10), (8, 22), (40, 200)):
+        payload = synthetic_episodes(seasons, episodes)
+        print(f"\n{seasons} seasons x {episodes} episodes")
+        print(f"{'codec':<14}{'bytes':>10}{'ratio':>8}{'encode us':>12}{'decode us':>12}")
+        baseline = len(CODECS["json"].encode(payload).encode("utf-8"))
+        for name, codec in CODECS.items():
+            encoded = codec.encode(payload)
+            size = len(encoded.encode("utf-8") if isinstance(encoded, str) else encoded)
+            encode_time = (
+                timeit.timeit(lambda codec=codec, payload=payload: codec.encode(payload), number=number) / number
+            )
+            decode_time = timeit.timeit(lambda encoded=encoded: decode_value(encoded), number=number) / number
+            print(f"{name:<14}{size:>10}{size / baseline:>8.2f}{encode_time * 1e6:>12.1f}{decode_time * 1e6:>12.1f}")
+
+
+def redis_memory():
+    aws_state = AWSStateData()
+    config = TunnelConfig(**aws_state.connection_params())
+    payload = synthetic_episodes(8, 22)
+    with SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(decode_responses=False)
+        for name, codec in CODECS.items():
+            key = f"bench:codec:{name}"
+            redis_client.hset(key, mapping={"title": "Benchmark", "episodes": codec.encode(payload)})
+            usage = redis_client.memory_usage(key)
+            assert redis_client.decode_record(redis_client.hgetall(key))["episodes"] == payload
+            print(f"{name:<14}{usage:>10} bytes in Redis")
+            redis_client.delete(key)
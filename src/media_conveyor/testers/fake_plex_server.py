@@ -0,0 +1,370 @@
+import multiprocessing
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+
+from ..logging import setup_logger
+
+logger = setup_logger()
+
+# Plex search type numbers, as used by the ``type`` query parameter.
+SEARCH_TYPES = {"movie": 1, "show": 2, "season": 3, "episode": 4, "artist": 8, "album": 9, "track": 10}
+METADATA_PATH = re.compile(r"^/library/metadata/(\d+)(/children)?$")
+SECTION_PATH = re.compile(r"^/library/sections/(\d+)/(all|collections)$")
+# The folders every generated file path lives under, reported as each section's Location.
+SECTION_ROOTS = {"movie": "/media/movies", "show": "/media/tv", "artist": "/media/music"}
+# Tags a real server lists for each item, which make up most of a listing's size.
+ITEM_TAGS = {
+    "movie": ("Genre", "Country", "Director", "Writer", "Role", "Role", "Role", "Role"),
+    "show": ("Genre", "Genre", "Country", "Role", "Role", "Role", "Role"),
+    "episode": ("Director", "Writer"),
+    "artist": ("Genre", "Country", "Similar", "Similar"),
+    "album": ("Genre", "Style", "Mood", "Mood"),
+}
+WORDS = ["Red", "Blue", "Night", "City", "River", "Storm", "Ghost", "Iron", "Last", "Golden", "Silent", "Wild"]
+
+
+class FakePlexLibrary:
+    """An in-memory Plex library that serves the XML a real server returns for the calls this project makes."""
+
+    def __init__(self, seed: int = 444) -> None:
+        self._random = random.Random(seed)
+        # Filler details draw from their own generator, so titles and years depend on the seed alone.
+        self._filler = random.Random(seed + 1)
+        self._next_key = 1000
+        self.sections = []
+        # Every item keyed by ratingKey, and the ordered children of every show, season and album.
+        self.metadata = {}
+        self.children = {}
+
+    def add_section(self, section_type: str, title: str) -> dict:
+        key = str(len(self.sections) + 1)
+        section = {
+            "key": key,
+            "type": section_type,
+            "title": title,
+            "uuid": f"fake-{section_type}-{key}",
+            "updatedAt": "1700000000",
+            "locations": [SECTION_ROOTS[section_type]],
+            # Items of every search type in this section, in listing order.
+            "items": {number: [] for number in SEARCH_TYPES.values()},
+        }
+        self.sections.append(section)
+        return section
+
+    def add_movie(self, section: dict, title: str, year: int = None) -> ElementTree.Element:
+        movie = self._item(section, "Video", "movie", title=title, year=year, thumb=self._thumb())
+        self._parts(movie, [f"{section['locations'][0]}/{title} ({year})/{title}.mkv"])
+        return movie
+
+    def add_show(self, section: dict, title: str, year: int = None) -> ElementTree.Element:
+        show = self._item(section, "Directory", "show", title=title, year=year, thumb=self._thumb())
+        ElementTree.SubElement(show, "Location", path=f"{section['locations'][0]}/{title}")
+        return show
+
+    def add_season(self, section: dict, show: ElementTree.Element, index: int) -> ElementTree.Element:
+        return self._item(section, "Directory", "season", parent=show, title=f"Season {index}", index=index)
+
+    def add_episode(self, section: dict, season: ElementTree.Element, index: int, title: str) -> ElementTree.Element:
+        show = self.metadata[season.get("parentRatingKey")]
+        episode = self._item(
+            section, "Video", "episode", parent=season, title=title, index=index, parentIndex=season.get("index")
+        )
+        episode.set("grandparentRatingKey", show.get("ratingKey"))
+        filename = f"{show.get('title')} - s{int(season.get('index')):02d}e{index:02d} - {title}.mkv"
+        self._parts(episode, [f"{show.find('Location').get('path')}/Season {season.get('index')}/{filename}"])
+        return episode
+
+    def add_artist(self, section: dict, title: str) -> ElementTree.Element:
+        return self._item(section, "Directory", "artist", title=title, thumb=self._thumb())
+
+    def add_album(self, section: dict, artist: ElementTree.Element, title: str, year: int = None):
+        return self._item(section, "Directory", "album", parent=artist, title=title, year=year)
+
+    def add_track(self, section: dict, album: ElementTree.Element, index: int, title: str) -> ElementTree.Element:
+        artist = self.metadata[album.get("parentRatingKey")]
+        track = self._item(section, "Track", "track", parent=album, title=title, index=index, parentIndex=1)
+        track.set("grandparentRatingKey", artist.get("ratingKey"))
+        location = section["locations"][0]
+        self._parts(track, [f"{location}/{artist.get('title')}/{album.get('title')}/{index:02d} {title}.flac"])
+        return track
+
+    def _item(self, section: dict, tag: str, item_type: str, parent=None, **attributes) -> ElementTree.Element:
+        self._next_key += 1
+        rating_key = str(self._next_key)
+        leaf = item_type in ("movie", "episode", "track")
+        item = ElementTree.Element(
+            tag,
+            ratingKey=rating_key,
+            key=f"/library/metadata/{rating_key}" + ("" if leaf else "/children"),
+            type=item_type,
+            librarySectionID=section["key"],
+            addedAt=str(1600000000 + self._next_key),
+            updatedAt=str(1600000000 + self._next_key),
+        )
+        for name, value in attributes.items():
+            if value is not None:
+                item.set(name, str(value))
+        if parent is not None:
+            item.set("parentRatingKey", parent.get("ratingKey"))
+            self.children.setdefault(parent.get("ratingKey"), []).append(item)
+        self._details(item, item_type)
+        self.metadata[rating_key] = item
+        section["items"][SEARCH_TYPES[item_type]].append(item)
+        return item
+
+    def _details(self, item: ElementTree.Element, item_type: str) -> None:
+        item.set("summary", " ".join(self._filler.choice(WORDS) for _ in range(self._filler.randint(20, 60))))
+        item.set("art", f"/library/metadata/{item.get('ratingKey')}/art/1700000000")
+        if item_type in ("movie", "show", "episode"):
+            item.set("contentRating", "TV-14")
+            item.set("studio", "Fake Studios")
+        for tag in ITEM_TAGS.get(item_type, ()):
+            ElementTree.SubElement(item, tag, id=str(self._filler.randint(1, 100000)), tag=self._filler.choice(WORDS))
+        if item_type in ("movie", "show", "album"):
+            ElementTree.SubElement(item, "Guid", id=f"tmdb://{item.get('ratingKey')}")
+            ElementTree.SubElement(item, "Rating", image="rottentomatoes://image.rating.ripe", type="critic", value="8")
+
+    def _thumb(self) -> str:
+        return f"/library/metadata/{self._next_key + 1}/thumb/{self._random.randint(1600000000, 1700000000)}"
+
+    @staticmethod
+    def _parts(item: ElementTree.Element, files: list) -> None:
+        audio = item.get("type") == "track"
+        media = ElementTree.SubElement(
+            item,
+            "Media",
+            id=item.get("ratingKey"),
+            duration="2400000",
+            bitrate="900" if audio else "8000",
+            audioCodec="flac" if audio else "aac",
+            audioChannels="2",
+            container="flac" if audio else "mkv",
+        )
+        if not audio:
+            media.attrib.update(videoCodec="h264", videoResolution="1080", width="1920", height="1080")
+        for number, file in enumerate(files):
+            ElementTree.SubElement(
+                media,
+                "Part",
+                id=f"{item.get('ratingKey')}{number}",
+                key=f"/library/parts/{item.get('ratingKey')}{number}/file",
+                duration="2400000",
+                size="1500000000",
+                file=file,
+            )
+
+
+def synthetic_library(
+    movies: int = 50,
+    shows: int = 10,
+    seasons: int = 3,
+    episodes: int = 8,
+    artists: int = 10,
+    albums: int = 3,
+    tracks: int = 10,
+    seed: int = 444,
+) -> FakePlexLibrary:
+    library = FakePlexLibrary(seed)
+
+    def title(number):
+        return f"{library._random.choice(WORDS)} {library._random.choice(WORDS)}: Part {number}"
+
+    movie_section = library.add_section("movie", "Movies")
+    for number in range(movies):
+        library.add_movie(movie_section, title(number), library._random.randint(1950, 2024))
+
+    show_section = library.add_section("show", "TV Shows")
+    for number in range(shows):
+        show = library.add_show(show_section, title(number), library._random.randint(1970, 2024))
+        for season_number in range(1, seasons + 1):
+            season = library.add_season(show_section, show, season_number)
+            for episode_number in range(1, episodes + 1):
+                library.add_episode(show_section, season, episode_number, f"Episode {episode_number}")
+
+    music_section = library.add_section("artist", "Music")
+    for number in range(artists):
+        artist = library.add_artist(music_section, title(number))
+        for album_number in range(albums):
+            album = library.add_album(
+                music_section, artist, f"Album {album_number}", library._random.randint(1960, 2024)
+            )
+            for track_number in range(1, tracks + 1):
+                library.add_track(music_section, album, track_number, f"Track {track_number}")
+    return library
+
+
+class FakePlexHandler(BaseHTTPRequestHandler):
+    server: "FakePlexServer"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        try:
+            container = self._route(url.path.rstrip("/") or "/", params)
+        except KeyError:
+            self.send_error(404)
+            return
+        body = ElementTree.tostring(container, encoding="utf-8", xml_declaration=True)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Fake Plex: {format % args}")
+
+    def _route(self, path: str, params: dict) -> ElementTree.Element:
+        library = self.server.library
+        if path == "/":
+            return ElementTree.Element(
+                "MediaContainer", friendlyName="Fake Plex", machineIdentifier="fake-plex", version="1.40.0.0"
+            )
+        if path == "/library":
+            container = ElementTree.Element("MediaContainer", title1="Plex Library")
+            ElementTree.SubElement(container, "Directory", key="sections", title="Library Sections")
+            return container
+        if path == "/library/sections":
+            container = ElementTree.Element("MediaContainer", size=str(len(library.sections)))
+            for section in library.sections:
+                attributes = {k: v for k, v in section.items() if k not in ("items", "locations")}
+                directory = ElementTree.SubElement(container, "Directory", attributes)
+                for number, location in enumerate(section["locations"], start=1):
+                    ElementTree.SubElement(directory, "Location", id=str(number), path=location)
+            return container
+
+        match = SECTION_PATH.match(path)
+        if match:
+            return self._section(*match.groups(), params)
+
+        match = METADATA_PATH.match(path)
+        if match:
+            rating_key, children = match.groups()
+            if children:
+                return self._page(library.children.get(rating_key, []), params)
+            item = library.metadata[rating_key]
+            return self._page([item], params, librarySectionID=item.get("librarySectionID"))
+        raise KeyError(path)
+
+    def _section(self, section_key: str, listing: str, params: dict) -> ElementTree.Element:
+        section = next(section for section in self.server.library.sections if section["key"] == section_key)
+        if "includeMeta" in params:
+            return self._filter_meta(listing == "all")
+        if listing == "collections":
+            return self._page([], params)
+        search_type = int(params.get("type", SEARCH_TYPES[section["type"]]))
+        items = section["items"][search_type]
+        if "artist.id" in params:
+            items = [item for item in items if item.get("parentRatingKey") == params["artist.id"]]
+        return self._page(items, params, librarySectionID=section["key"])
+
+    def _page(self, items: list, params: dict, **attributes) -> ElementTree.Element:
+        # Plex takes the container window from either the headers or the query string.
+        start = int(self.headers.get("X-Plex-Container-Start") or params.get("X-Plex-Container-Start") or 0)
+        size = self.headers.get("X-Plex-Container-Size") or params.get("X-Plex-Container-Size")
+        page = items[start:] if size is None else items[start : start + int(size)]
+        container = ElementTree.Element(
+            "MediaContainer", size=str(len(page)), totalSize=str(len(items)), offset=str(start), **attributes
+        )
+        fields = set(filter(None, params.get("excludeFields", "").split(",")))
+        elements = set(filter(None, params.get("excludeElements", "").split(",")))
+        if fields or elements:
+            page = [self._exclude(item, fields, elements) for item in page]
+        container.extend(page)
+        return container
+
+    @staticmethod
+    def _exclude(item: ElementTree.Element, fields: set, elements: set) -> ElementTree.Element:
+        # Plex's excludeFields and excludeElements drop attributes and child tags of the listed items only.
+        lean = ElementTree.Element(item.tag, {k: v for k, v in item.attrib.items() if k not in fields})
+        lean.extend(child for child in item if child.tag not in elements)
+        return lean
+
+    @staticmethod
+    def _filter_meta(types: bool = True) -> ElementTree.Element:
+        # Just enough filter metadata for plexapi to accept the ``<type>.id`` filters used by Artist.albums().
+        container = ElementTree.Element("MediaContainer", size="0")
+        meta = ElementTree.SubElement(container, "Meta")
+        if not types:
+            return container
+        for item_type, number in SEARCH_TYPES.items():
+            filter_type = ElementTree.SubElement(
+                meta, "Type", key=f"/library/sections/all?type={number}", type=item_type, title=item_type
+            )
+            ElementTree.SubElement(filter_type, "Field", key=f"{item_type}.id", title="ID", type="integer")
+        field_type = ElementTree.SubElement(meta, "FieldType", type="integer")
+        ElementTree.SubElement(field_type, "Operator", key="=", title="is")
+        return container
+
+
+class FakePlexServer(ThreadingHTTPServer):
+    """Serves a ``FakePlexLibrary`` over HTTP on a background thread.
+
+    ``latency`` adds a fixed delay to every response, which makes the cost of serial requests visible.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, library: FakePlexLibrary, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), FakePlexHandler)
+        self.library = library
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def baseurl(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePlexServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Plex server listening on {self.baseurl}")
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakePlexServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+
+@contextmanager
+def fake_plex_process(latency: float = 0.0, seed: int = 444, **shape):
+    """Serve a synthetic library from a child process and yield its base URL.
+
+    Out of process the server neither competes with the harvester for the GIL nor shows up in its memory
+    measurements, which is what benchmarks need.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(shape, seed, latency, ready), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=600)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _serve(shape: dict, seed: int, latency: float, ready) -> None:
+    server = FakePlexServer(synthetic_library(**shape, seed=seed), latency=latency)
+    ready.put(server.baseurl)
+    server.serve_forever()
@@ -3,11 +3,15 @@ from pathlib import Path
 from pprint import pprint
 
 from ..authentication import AWSCredentials, PlexAuthentication
+from ..configurations import Configuration
 from ..connections import SSHTunnel, TunnelConfig
 from ..infrastructure import AWSStateData
 from ..logging import setup_logger
+from ..metrics import metrics
 from ..plex_data import PlexData
 from ..redis_db import RedisPlexDB
+from ..snapshot import SnapshotCache
+from ..state import SyncState, UploadCheckpoint
 
 logger = setup_logger()
 setup_logger(level="INFO")
@@ -38,15 +42,115 @@ def write():
         redis_client.make_db()
 
 
-def read():
+def stream(normalized=False, pipelines=1):
+    aws_state = AWSStateData()
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    config = TunnelConfig(**aws_state.connection_params())
+    with SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(max_connections=pipelines + 1)
+        records = plex_data.iter_libraries(movies=True, shows=True, music=True, normalized=normalized)
+        redis_client.write_records(
+            records, chunk_size=500, transaction=False, checkpoint=UploadCheckpoint("stream"), pipelines=pipelines
+        )
+
+
+def parallel_stream():
+    stream(pipelines=4)
+
+
+def profile():
+    # Upload the whole library, then break the run down by stage in a JSON report and a Prometheus file.
+    metrics.reset()
+    aws_state = AWSStateData()
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    plex_db = plex_data.compile_libraries(movies=True, shows=True, music=True)
+    config = TunnelConfig(**aws_state.connection_params())
+    with SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(plex_db=plex_db)
+        redis_client.make_db(chunk_size=500, transaction=False)
+    state_path = Configuration().state_path
+    state_path.mkdir(parents=True, exist_ok=True)
+    report = metrics.write_report(state_path / "run_report.json")
+    metrics.write_prometheus(state_path / "media_conveyor.prom")
+    for stage, summary in report["stages"].items():
+        print(
+            f"{stage:<16}{summary['calls']:>8} calls{summary['total_seconds']:>10.2f}s  p95 {summary['p95_seconds']:.4f}s"
+        )
+
+
+def publish():
+    aws_state = AWSStateData()
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    config = TunnelConfig(**aws_state.connection_params())
+    with SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(indexes=True)
+        records = plex_data.iter_libraries(movies=True, shows=True, music=True)
+        redis_client.publish_version(records)
+        redis_client.reclaim_thread.join()
+
+
+def snapshot():
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    with SnapshotCache() as cache:
+        for _ in plex_data.iter_libraries(movies=True, shows=True, music=True, snapshot=cache):
+            pass
+
+
+def restore():
     aws_state = AWSStateData()
     config = TunnelConfig(**aws_state.connection_params())
+    with SnapshotCache(ttl=None) as cache, SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(indexes=True)
+        redis_client.publish_version(cache.iter_records())
+        redis_client.reclaim_thread.join()
+
+
+def diff():
+    aws_state = AWSStateData()
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    config = TunnelConfig(**aws_state.connection_params())
     with SSHTunnel(config) as _:
         redis_client = RedisPlexDB()
-        keys = redis_client.keys()
-        for key in keys:
+        records = plex_data.iter_libraries(movies=True, shows=True, music=True)
+        counts = redis_client.diff_db(records)
+        pprint(counts)
+
+
+def sync(full=False):
+    aws_state = AWSStateData()
+    plex_auth = PlexAuthentication()
+    plex_data = PlexData(plex_auth.baseurl, plex_auth.token)
+    sync_state = SyncState()
+    changes_db, removed_keys = plex_data.compile_changes(sync_state, movies=True, shows=True, music=True, full=full)
+    if not changes_db and not removed_keys:
+        logger.info("Redis is already up to date")
+        sync_state.save()
+        return
+    config = TunnelConfig(**aws_state.connection_params())
+    with SSHTunnel(config) as _:
+        redis_client = RedisPlexDB(plex_db=changes_db or None)
+        redis_client.make_db(removed_keys=removed_keys)
+    sync_state.save()
+
+
+def full_sync():
+    sync(full=True)
+
+
+def read():
+    aws_state = AWSStateData()
+    config = TunnelConfig(**aws_state.connection_params())
+    with SSHTunnel(config) as _:
+        # Not decoding responses keeps values of every codec readable.
+        redis_client = RedisPlexDB(decode_responses=False)
+        for key, record in redis_client.iter_records():
             print(key)
-            print(redis_client.hgetall(key))
+            print(record)
 
 
 def delete_db():
@@ -1,6 +1,10 @@
+import json
 import os
 import secrets
 import string
+import threading
+import time
+from pathlib import Path
 
 from .logging import setup_logger
 
@@ -34,3 +38,41 @@ def set_file_permissions(file_path):
         logger.error(f"Error setting permissions on file: {e}")
         return False
     return True
+
+
+def write_json_atomic(file_path, data, **kwargs) -> None:
+    write_text_atomic(file_path, json.dumps(data, **kwargs))
+
+
+def write_text_atomic(file_path, text: str) -> None:
+    # Write to a sibling temp file and rename it over the target so readers never see a partial file.
+    file_path = Path(file_path)
+    # The thread id keeps two threads of one process that write the same file from sharing a temp file.
+    temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, "w") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+class RateLimiter:
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self) -> None:
+        # Reserve the next free slot under the lock, then sleep outside it so other threads can queue up.
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
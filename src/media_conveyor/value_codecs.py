@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .logging import setup_logger
+
+logger = setup_logger()
+
+# Binary values start with a NUL byte followed by a one byte tag.  Plain JSON values carry no header, so
+# everything written before codecs existed still decodes.
+HEADER = b"\x00"
+TAGS = {
+    b"j": ("json", False),
+    b"J": ("json", True),
+    b"m": ("msgpack", False),
+    b"M": ("msgpack", True),
+}
+
+
+class ValueCodec:
+    name: str = None
+
+    def __init__(self, compress_threshold: int = None, compress_level: int = 6) -> None:
+        if compress_threshold is not None and compress_threshold < 0:
+            raise ValueError("compress_threshold must be a non-negative integer")
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, value: Any) -> Union[str, bytes]:
+        payload = self._dumps(value)
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            return HEADER + self._tag(True) + zlib.compress(payload, self.compress_level)
+        return HEADER + self._tag(False) + payload
+
+    def decode(self, raw: Union[str, bytes]) -> Any:
+        return decode_value(raw)
+
+    @property
+    def binary(self) -> bool:
+        """Whether encoded values are bytes, which Redis clients with ``decode_responses`` cannot always read."""
+        return True
+
+    def _tag(self, compressed: bool) -> bytes:
+        return next(tag for tag, spec in TAGS.items() if spec == (self.name, compressed))
+
+    def _dumps(self, value: Any) -> bytes:
+        raise NotImplementedError("Subclasses should implement this!")
+
+
+class JSONCodec(ValueCodec):
+    name = "json"
+
+    def encode(self, value: Any) -> Union[str, bytes]:
+        if self.compress_threshold is None:
+            # Uncompressed JSON is stored exactly as json.dumps renders it, as it always has been.
+            return json.dumps(value)
+        return super().encode(value)
+
+    @property
+    def binary(self) -> bool:
+        return self.compress_threshold is not None
+
+    def _dumps(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class MsgpackCodec(ValueCodec):
+    name = "msgpack"
+
+    def __init__(self, compress_threshold: int = None, compress_level: int = 6) -> None:
+        if msgpack is None:
+            raise ImportError("MsgpackCodec requires the msgpack package. Install media_conveyor[msgpack].")
+        super().__init__(compress_threshold, compress_level)
+
+    def _dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+
+def decode_value(raw: Union[str, bytes]) -> Any:
+    if isinstance(raw, str):
+        if not raw.startswith(HEADER.decode("ascii")):
+            return json.loads(raw)
+        # A binary value that happened to be valid UTF-8 and was decoded by the client on the way in.
+        raw = raw.encode("utf-8")
+    if not raw.startswith(HEADER):
+        return json.loads(raw.decode("utf-8"))
+
+    try:
+        name, compressed = TAGS[raw[1:2]]
+    except KeyError:
+        logger.error(f"Unknown codec tag {raw[1:2]!r}")
+        raise ValueError(f"Unknown codec tag {raw[1:2]!r}") from None
+    payload = raw[2:]
+    if compressed:
+        payload = zlib.decompress(payload)
+    if name == "json":
+        return json.loads(payload.decode("utf-8"))
+    if msgpack is None:
+        raise ImportError("Decoding msgpack values requires the msgpack package. Install media_conveyor[msgpack].")
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)